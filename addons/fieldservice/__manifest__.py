@@ -3,14 +3,16 @@
 {
     "name": "Field Service",
     "summary": "Manage Field Service Locations, Workers and Orders",
-    "version": "18.0.1.2.1",
+    "version": "18.0.1.3.0",
     "license": "AGPL-3",
     "category": "Field Service",
     "author": "Open Source Integrators, Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/field-service",
     "depends": ["base_territory", "base_geolocalize", "resource", "contacts"],
+    "external_dependencies": {"python": ["numpy"]},
     "data": [
         "data/ir_sequence.xml",
+        "data/ir_cron.xml",
         "data/mail_message_subtype.xml",
         "data/module_category.xml",
         "data/fsm_stage.xml",
@@ -19,6 +21,7 @@
         "security/ir.model.access.csv",
         "security/ir_rule.xml",
         "report/fsm_order_report_template.xml",
+        "report/fsm_order_report_views.xml",
         "views/res_config_settings.xml",
         "views/res_territory.xml",
         "views/fsm_stage.xml",
@@ -35,6 +38,7 @@
         "views/fsm_team.xml",
         "views/menu.xml",
         "wizard/fsm_wizard.xml",
+        "wizard/fsm_order_stage_wizard.xml",
     ],
     "demo": [
         "demo/fsm_demo.xml",
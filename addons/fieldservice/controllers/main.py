@@ -0,0 +1,86 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import hashlib
+import json
+from datetime import timedelta
+
+from werkzeug.exceptions import BadRequest
+
+from odoo import fields, http
+from odoo.http import request
+
+CALENDAR_FEED_MAX_RANGE = timedelta(days=62)
+
+
+class FieldServiceController(http.Controller):
+    @http.route(
+        "/fieldservice/calendar/orders", type="http", auth="user", methods=["GET"]
+    )
+    def calendar_orders(self, start=None, end=None, person_ids=None, **kwargs):
+        """Compact JSON feed of the orders scheduled between ``start`` and
+        ``end`` (UTC, ``YYYY-MM-DD HH:MM:SS``), optionally for a
+        comma-separated list of workers.
+
+        The ``ETag`` is the version of the orders of the range, see
+        ``fsm.order._get_calendar_feed_version()``. A request with a matching
+        ``If-None-Match`` gets an empty ``304 Not Modified`` without the feed
+        being built.
+        """
+        if not (start and end):
+            raise BadRequest("Missing date range")
+        try:
+            date_start = fields.Datetime.to_datetime(start)
+            date_end = fields.Datetime.to_datetime(end)
+            if person_ids is not None:
+                person_ids = [int(pid) for pid in person_ids.split(",") if pid]
+        except ValueError as e:
+            raise BadRequest(str(e)) from e
+        if not date_start < date_end <= date_start + CALENDAR_FEED_MAX_RANGE:
+            raise BadRequest("Invalid or too large date range")
+        Order = request.env["fsm.order"]
+        version = Order._get_calendar_feed_version(date_start, date_end, person_ids)
+        etag = hashlib.sha256(
+            f"{version}:{start}:{end}:{person_ids}".encode()
+        ).hexdigest()[:32]
+
+        def body():
+            payload = Order._get_calendar_feed(date_start, date_end, person_ids)
+            return json.dumps(payload, separators=(",", ":"))
+
+        return self._etag_response(etag, body)
+
+    @http.route(
+        "/fieldservice/stages/colors", type="http", auth="user", methods=["GET"]
+    )
+    def stage_colors(self, **kwargs):
+        """Color legend of the stages, as returned by
+        ``fsm.stage.get_color_information()`` along with the id and the color
+        of each stage.
+
+        The ``ETag`` is the version of the cached legend, so a client holding
+        the current one gets a ``304 Not Modified`` without any query.
+        """
+        Stage = request.env["fsm.stage"]
+        version, legend = Stage._get_color_legend(tuple(request.env.companies.ids))
+
+        def body():
+            return json.dumps(
+                {
+                    "version": version,
+                    "colors": {stage_id: color for stage_id, __, color in legend},
+                    "legend": Stage.get_color_information(),
+                },
+                separators=(",", ":"),
+            )
+
+        return self._etag_response(version, body)
+
+    def _etag_response(self, etag, body):
+        """Return the JSON ``body()``, or an empty ``304 Not Modified`` when
+        the client already has ``etag``"""
+        headers = [("ETag", f'"{etag}"'), ("Cache-Control", "private, no-cache")]
+        if etag in request.httprequest.if_none_match:
+            return request.make_response(b"", headers=headers, status=304)
+        return request.make_response(
+            body(), headers=headers + [("Content-Type", "application/json")]
+        )
@@ -0,0 +1,17 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    # The equipment backfill is now a one-shot job enabled from the company
+    # settings, the cron record itself is not updated (noupdate)
+    cr.execute("""
+        UPDATE ir_cron SET active = FALSE
+        WHERE id IN (
+            SELECT res_id FROM ir_model_data
+            WHERE module = 'fieldservice'
+                AND name = 'ir_cron_fsm_order_backfill_equipment'
+        )
+        """)
+    # Open orders are matched with "is_closed IS NULL OR is_closed = FALSE"
+    # like the ORM does, the flag is never left empty
+    cr.execute("UPDATE fsm_order SET is_closed = FALSE WHERE is_closed IS NULL")
@@ -0,0 +1,31 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    # Active stages of a type now need distinct sequences within a company,
+    # see fsm.stage._sql_constraints. The stages of the types and companies
+    # holding duplicates are renumbered in their current order.
+    cr.execute("""
+        WITH duplicated AS (
+            SELECT DISTINCT stage_type, COALESCE(company_id, 0) AS company_id
+            FROM fsm_stage
+            WHERE active IS TRUE
+            GROUP BY stage_type, COALESCE(company_id, 0), sequence
+            HAVING COUNT(*) > 1
+        ),
+        renumbered AS (
+            SELECT stage.id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY stage.stage_type, COALESCE(stage.company_id, 0)
+                    ORDER BY stage.sequence, stage.name, stage.id
+                ) AS sequence
+            FROM fsm_stage stage
+            JOIN duplicated
+                ON duplicated.stage_type = stage.stage_type
+                AND duplicated.company_id = COALESCE(stage.company_id, 0)
+            WHERE stage.active IS TRUE
+        )
+        UPDATE fsm_stage stage SET sequence = renumbered.sequence
+        FROM renumbered
+        WHERE stage.id = renumbered.id
+        """)
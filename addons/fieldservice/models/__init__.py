@@ -2,11 +2,17 @@
 
 from . import (
     res_company,
+    resource_calendar,
+    mail_message_subtype,
     res_config_settings,
     fsm_model_mixin,
+    fsm_geo_mixin,
+    fsm_parent_store_mixin,
     fsm_category,
     fsm_template,
     res_territory,
+    res_branch,
+    res_district,
     fsm_tag,
     fsm_stage,
     fsm_team,
@@ -1,14 +1,34 @@
 # Copyright (C) 2018 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models
+from collections import defaultdict
+
+from odoo import _, api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import SQL
+
+# Levels of the territory hierarchy of equipment, from the bottom, with the
+# model of each level and its field pointing to the next one
+TERRITORY_HIERARCHY = [
+    ("territory_id", "res.territory", "branch_id"),
+    ("branch_id", "res.branch", "district_id"),
+    ("district_id", "res.district", "region_id"),
+    ("region_id", "res.region", None),
+]
 
 
 class FSMEquipment(models.Model):
     _name = "fsm.equipment"
     _description = "Field Service Equipment"
-    _inherit = ["mail.thread", "mail.activity.mixin", "fsm.model.mixin"]
+    _inherit = [
+        "mail.thread",
+        "mail.activity.mixin",
+        "fsm.model.mixin",
+        "fsm.parent.store.mixin",
+    ]
     _stage_type = "equipment"
+    _parent_store = True
 
     name = fields.Char(required=True)
     person_id = fields.Many2one("fsm.person", string="Assigned Operator")
@@ -17,36 +37,48 @@ class FSMEquipment(models.Model):
     territory_id = fields.Many2one(
         "res.territory",
         string="Territory",
-        compute="_compute_territory_id",
+        compute="_compute_territory_hierarchy",
         store=True,
         readonly=False,
     )
     branch_id = fields.Many2one(
         "res.branch",
         string="Branch",
-        compute="_compute_branch_id",
+        compute="_compute_territory_hierarchy",
         store=True,
         readonly=False,
     )
     district_id = fields.Many2one(
         "res.district",
         string="District",
-        compute="_compute_district_id",
+        compute="_compute_territory_hierarchy",
         store=True,
         readonly=False,
     )
     region_id = fields.Many2one(
         "res.region",
         string="Region",
-        compute="_compute_region_id",
+        compute="_compute_territory_hierarchy",
         store=True,
         readonly=False,
     )
     current_location_id = fields.Many2one("fsm.location", string="Current Location")
     managed_by_id = fields.Many2one("res.partner", string="Managed By")
     owned_by_id = fields.Many2one("res.partner", string="Owned By")
-    parent_id = fields.Many2one("fsm.equipment", string="Parent")
+    parent_id = fields.Many2one("fsm.equipment", string="Parent", index=True)
+    parent_path = fields.Char(index=True)
     child_ids = fields.One2many("fsm.equipment", "parent_id", string="Children")
+    child_count = fields.Integer(compute="_compute_subtree_counts")
+    descendant_count = fields.Integer(
+        string="Components",
+        compute="_compute_subtree_counts",
+        help="Number of equipment below this one, at any depth",
+    )
+    open_order_count = fields.Integer(
+        string="Open Orders",
+        compute="_compute_subtree_counts",
+        help="Number of open orders on this equipment or on its components",
+    )
     color = fields.Integer("Color Index")
     company_id = fields.Many2one(
         "res.company",
@@ -61,22 +93,213 @@ class FSMEquipment(models.Model):
         ("name_uniq", "unique (name)", "Equipment name already exists!")
     ]
 
+    @api.constrains("parent_id")
+    def _check_equipment_recursion(self):
+        if self._has_cycle("parent_id"):
+            raise ValidationError(_("You cannot create recursive equipment."))
+
+    @api.depends("child_ids")
+    def _compute_subtree_counts(self):
+        equipments = self.browse([eq._origin.id for eq in self if eq._origin.id])
+        children = defaultdict(int)
+        for parent, count in self._read_group(
+            [("parent_id", "in", equipments.ids)], ["parent_id"], ["__count"]
+        ):
+            children[parent.id] = count
+        descendants = equipments._read_subtree_ids("fsm.equipment", "parent_id")
+        open_domain = [("is_closed", "=", False)]
+        orders = equipments._read_subtree_ids("fsm.order", "equipment_ids", open_domain)
+        for eq_id, order_ids in equipments._read_subtree_ids(
+            "fsm.order", "equipment_id", open_domain
+        ).items():
+            orders[eq_id] |= order_ids
+        for equipment in self:
+            eq_id = equipment._origin.id
+            equipment.child_count = children[eq_id]
+            equipment.descendant_count = len(descendants.get(eq_id, ()))
+            equipment.open_order_count = len(orders.get(eq_id, ()))
+
+    def action_view_components(self):
+        """Open all the equipment below ``self``"""
+        action = self.env["ir.actions.act_window"]._for_xml_id(
+            "fieldservice.action_fsm_equipment"
+        )
+        action["context"] = dict(self.env.context, group_by="")
+        action["domain"] = self._subtree_domain(include_self=False)
+        return action
+
+    def action_view_open_orders(self):
+        """Open the open orders of ``self`` and of its components"""
+        action = self.env["ir.actions.act_window"]._for_xml_id(
+            "fieldservice.action_fsm_operation_order"
+        )
+        action["context"] = dict(self.env.context, group_by="")
+        action["domain"] = expression.AND(
+            [
+                [("is_closed", "=", False)],
+                expression.OR(
+                    [
+                        [("equipment_ids", "child_of", self.ids)],
+                        [("equipment_id", "child_of", self.ids)],
+                    ]
+                ),
+            ]
+        )
+        return action
+
+    @api.model
+    def _resolve_territory_hierarchy(self, level, ids):
+        """Return the ids of the levels above ``level`` (a field name of
+        ``TERRITORY_HIERARCHY``) of each of ``ids``, with a single query.
+
+        :return: dict ``{id: {field name: id or None}}``
+        """
+        start = [name for name, __, __ in TERRITORY_HIERARCHY].index(level)
+        levels = TERRITORY_HIERARCHY[start:]
+        for __, model, parent in levels[:-1]:
+            self.env[model].flush_model([parent])
+        joins = []
+        for index, ((__, __, parent), (__, model, __)) in enumerate(
+            zip(levels, levels[1:])
+        ):
+            joins.append(
+                SQL(
+                    "LEFT JOIN %s AS %s ON %s = %s",
+                    SQL.identifier(self.env[model]._table),
+                    SQL.identifier(f"l{index + 1}"),
+                    SQL.identifier(f"l{index + 1}", "id"),
+                    SQL.identifier(f"l{index}", parent),
+                )
+            )
+        self.env.cr.execute(
+            SQL(
+                "SELECT %s FROM %s AS l0 %s WHERE l0.id = ANY(%s)",
+                SQL(", ").join(
+                    SQL.identifier(f"l{index}", "id") for index in range(len(levels))
+                ),
+                SQL.identifier(self.env[levels[0][1]]._table),
+                SQL(" ").join(joins),
+                list(ids),
+            )
+        )
+        names = [name for name, __, __ in levels[1:]]
+        return {row[0]: dict(zip(names, row[1:])) for row in self.env.cr.fetchall()}
+
     @api.depends("location_id")
-    def _compute_territory_id(self):
+    def _compute_territory_hierarchy(self):
+        territories = self.location_id.territory_id
+        chains = self._resolve_territory_hierarchy("territory_id", territories.ids)
         for rec in self:
-            rec.territory_id = rec.location_id.territory_id
+            territory = rec.location_id.territory_id
+            chain = chains.get(territory.id, {})
+            rec.territory_id = territory
+            rec.branch_id = chain.get("branch_id")
+            rec.district_id = chain.get("district_id")
+            rec.region_id = chain.get("region_id")
 
-    @api.depends("territory_id")
-    def _compute_branch_id(self):
-        for rec in self:
-            rec.branch_id = rec.territory_id.branch_id
+    @api.model
+    def _complete_territory_hierarchy(self, vals_list):
+        """Fill in ``vals_list`` the levels above the lowest level of the
+        territory hierarchy given in each vals, with one query per level."""
+        names = [name for name, __, __ in TERRITORY_HIERARCHY]
+        todo = {}
+        for vals in vals_list:
+            level = next((name for name in names[:-1] if name in vals), None)
+            if not level:
+                continue
+            if vals[level]:
+                todo.setdefault(level, []).append(vals)
+            else:
+                for name in names[names.index(level) + 1 :]:
+                    vals.setdefault(name, False)
+        for level, level_vals in todo.items():
+            chains = self._resolve_territory_hierarchy(
+                level, {vals[level] for vals in level_vals}
+            )
+            for vals in level_vals:
+                for name, value in chains.get(vals[level], {}).items():
+                    vals.setdefault(name, value or False)
 
-    @api.depends("branch_id")
-    def _compute_district_id(self):
-        for rec in self:
-            rec.district_id = rec.branch_id.district_id
+    @api.onchange("territory_id")
+    def _onchange_territory_id(self):
+        self.branch_id = self.territory_id.branch_id
 
-    @api.depends("district_id")
-    def _compute_region_id(self):
-        for rec in self:
-            rec.region_id = rec.district_id.region_id
+    @api.onchange("branch_id")
+    def _onchange_branch_id(self):
+        self.district_id = self.branch_id.district_id
+
+    @api.onchange("district_id")
+    def _onchange_district_id(self):
+        self.region_id = self.district_id.region_id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        vals_list = [dict(vals) for vals in vals_list]
+        self._complete_territory_hierarchy(vals_list)
+        return super().create(vals_list)
+
+    def write(self, vals):
+        vals = dict(vals)
+        self._complete_territory_hierarchy([vals])
+        return super().write(vals)
+
+    @api.model
+    def _realign_territory_hierarchy(self, level, old_parents):
+        """Follow a change of parent of records of a level of the territory
+        hierarchy on the equipment below them, in a single UPDATE.
+
+        Only the equipment still aligned on the previous parent are updated,
+        the values set by hand are kept.
+
+        :param level: field name of ``TERRITORY_HIERARCHY`` of the records
+        :param old_parents: dict mapping the ids of the records to the id of
+            their parent before the change
+        """
+        names = [name for name, __, __ in TERRITORY_HIERARCHY]
+        above = names[names.index(level) + 1 :]
+        chains = self._resolve_territory_hierarchy(level, list(old_parents))
+        rows = [
+            SQL(
+                "(%s)",
+                SQL(", ").join(
+                    SQL("%s::int", value)
+                    for value in (
+                        record_id,
+                        old_parent or None,
+                        *(chains[record_id][name] for name in above),
+                    )
+                ),
+            )
+            for record_id, old_parent in old_parents.items()
+            if record_id in chains
+            and (chains[record_id][above[0]] or False) != (old_parent or False)
+        ]
+        if not rows:
+            return
+        self.flush_model([level, *above])
+        self.env.cr.execute(
+            SQL(
+                """
+                UPDATE fsm_equipment e SET %(assignments)s,
+                    write_uid = %(uid)s, write_date = %(write_date)s
+                FROM (VALUES %(rows)s) AS chain(id, old_parent, %(names)s)
+                WHERE %(level)s = chain.id
+                    AND %(parent)s IS NOT DISTINCT FROM chain.old_parent
+                """,
+                assignments=SQL(", ").join(
+                    SQL(
+                        "%s = %s",
+                        SQL.identifier(name),
+                        SQL.identifier("chain", name),
+                    )
+                    for name in above
+                ),
+                uid=self.env.uid,
+                write_date=self.env.cr.now(),
+                rows=SQL(", ").join(rows),
+                names=SQL(", ").join(SQL.identifier(name) for name in above),
+                level=SQL.identifier("e", level),
+                parent=SQL.identifier("e", above[0]),
+            )
+        )
+        self.invalidate_model([*above, "write_uid", "write_date"])
@@ -0,0 +1,124 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import math
+
+from odoo import api, models
+from odoo.tools import SQL
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Radius of the first area searched for the nearest records, multiplied by
+# GEO_NEAREST_GROWTH until enough records are found or the whole globe is
+# covered
+GEO_NEAREST_RADIUS = 25
+GEO_NEAREST_GROWTH = 4
+GEO_MAX_DISTANCE = math.pi * EARTH_RADIUS_KM
+
+
+def geo_box(latitude, longitude, radius):
+    """Return the ``(lat_min, lat_max, lon_ranges)`` bounding box of the
+    circle of ``radius`` km around the point.
+
+    ``lon_ranges`` is empty when the box spans all the longitudes, and holds
+    two ranges when it crosses the antimeridian.
+    """
+    lat_span = radius / KM_PER_DEGREE
+    lat_min, lat_max = latitude - lat_span, latitude + lat_span
+    cos_lat = math.cos(math.radians(min(max(abs(lat_min), abs(lat_max)), 90)))
+    if cos_lat < 1e-6 or lat_span / cos_lat >= 180:
+        return lat_min, lat_max, []
+    lon_span = lat_span / cos_lat
+    lon_min, lon_max = longitude - lon_span, longitude + lon_span
+    if lon_min < -180:
+        lon_ranges = [(lon_min + 360, 180), (-180, lon_max)]
+    elif lon_max > 180:
+        lon_ranges = [(lon_min, 180), (-180, lon_max - 360)]
+    else:
+        lon_ranges = [(lon_min, lon_max)]
+    return lat_min, lat_max, lon_ranges
+
+
+class FsmGeoMixin(models.AbstractModel):
+    """Nearest and radius lookups on the coordinates of the related partner.
+
+    The candidates are selected in the database on the bounding box of the
+    searched circle, served by the coordinates index of ``res.partner``, then
+    ranked on their great-circle distance in the same query.
+    """
+
+    _name = "fsm.geo.mixin"
+    _description = "Field Service Spatial Search Mixin"
+
+    @api.model
+    def _geo_search(self, latitude, longitude, radius, domain=None, limit=None):
+        """Return the records matching ``domain`` at most ``radius`` km away
+        from the point, closest first."""
+        self.flush_model(["partner_id"])
+        self.env["res.partner"].flush_model(["partner_latitude", "partner_longitude"])
+        query = self._search(domain or [], limit=limit)
+        partner = query.make_alias(self._table, "partner_id")
+        query.add_join(
+            "JOIN",
+            partner,
+            "res_partner",
+            SQL(
+                "%s = %s",
+                SQL.identifier(partner, "id"),
+                SQL.identifier(query.table, "partner_id"),
+            ),
+        )
+        lat = SQL.identifier(partner, "partner_latitude")
+        lon = SQL.identifier(partner, "partner_longitude")
+        # Same predicate as the partial coordinates index of res.partner
+        query.add_where(SQL("(%s != 0 OR %s != 0)", lat, lon))
+        lat_min, lat_max, lon_ranges = geo_box(latitude, longitude, radius)
+        query.add_where(SQL("%s BETWEEN %s AND %s", lat, lat_min, lat_max))
+        if lon_ranges:
+            query.add_where(
+                SQL(
+                    "(%s)",
+                    SQL(" OR ").join(
+                        SQL("%s BETWEEN %s AND %s", lon, lon_min, lon_max)
+                        for lon_min, lon_max in lon_ranges
+                    ),
+                )
+            )
+        distance = SQL(
+            """
+            2 * %s * ASIN(SQRT(LEAST(1,
+                POWER(SIN(RADIANS(%s - %s) / 2), 2)
+                + COS(RADIANS(%s)) * COS(RADIANS(%s))
+                * POWER(SIN(RADIANS(%s - %s) / 2), 2)
+            )))
+            """,
+            EARTH_RADIUS_KM,
+            lat,
+            latitude,
+            latitude,
+            lat,
+            lon,
+            longitude,
+        )
+        query.add_where(SQL("%s <= %s", distance, radius))
+        query.order = SQL("%s, %s", distance, SQL.identifier(query.table, "id"))
+        return self.browse(query)
+
+    @api.model
+    def geo_nearest(self, latitude, longitude, limit=1, domain=None):
+        """Return the ``limit`` records closest to the point, closest first.
+
+        Only the records matching ``domain`` (and readable by the user) are
+        returned. The searched area grows until it holds enough of them.
+        """
+        radius = GEO_NEAREST_RADIUS
+        while True:
+            records = self._geo_search(latitude, longitude, radius, domain, limit)
+            if len(records) >= limit or radius >= GEO_MAX_DISTANCE:
+                return records
+            radius = min(radius * GEO_NEAREST_GROWTH, GEO_MAX_DISTANCE)
+
+    @api.model
+    def geo_within(self, latitude, longitude, radius, domain=None):
+        """Return the records at most ``radius`` km away from the point,
+        closest first."""
+        return self._geo_search(latitude, longitude, radius, domain)
@@ -1,17 +1,33 @@
 # Copyright (C) 2018 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
+import logging
+
+import psycopg2
+
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
+from odoo.osv import expression
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
 
 
 class FSMLocation(models.Model):
     _name = "fsm.location"
     _inherits = {"res.partner": "partner_id"}
-    _inherit = ["mail.thread", "mail.activity.mixin", "fsm.model.mixin"]
+    _inherit = [
+        "mail.thread",
+        "mail.activity.mixin",
+        "fsm.model.mixin",
+        "fsm.geo.mixin",
+        "fsm.parent.store.mixin",
+    ]
     _description = "Field Service Location"
     _stage_type = "location"
     _rec_names_search = ["complete_name"]
+    _parent_name = "fsm_parent_id"
+    _parent_store = True
 
     direction = fields.Char()
     partner_id = fields.Many2one(
@@ -55,6 +71,7 @@ class FSMLocation(models.Model):
 
     calendar_id = fields.Many2one("resource.calendar", string="Office Hours")
     fsm_parent_id = fields.Many2one("fsm.location", string="Parent", index=True)
+    parent_path = fields.Char(index=True)
     notes = fields.Text(string="Location Notes")
     person_ids = fields.One2many("fsm.location.person", "location_id", string="Workers")
     contact_count = fields.Integer(
@@ -66,14 +83,52 @@ class FSMLocation(models.Model):
     sublocation_count = fields.Integer(
         string="Sub Locations", compute="_compute_sublocation_ids"
     )
+    # Sub-locations are kept up to date by _update_subtree_complete_names()
     complete_name = fields.Char(
-        compute="_compute_complete_name", recursive=True, store=True
-    )
-    complete_direction = fields.Char(
-        compute="_compute_complete_direction",
-        store=True,
-        recursive=True,
+        compute="_compute_complete_name", store=True, index="trigram"
     )
+    complete_direction = fields.Char(compute="_compute_complete_direction", store=True)
+
+    def _auto_init(self):
+        # pg_trgm is a trusted extension, the database owner can enable it
+        # so that complete_name gets a GIN trigram index instead of a btree
+        if not self.env.registry.has_trigram:
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self.env.cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                self.env.registry.has_trigram = True
+            except psycopg2.Error:
+                _logger.warning(
+                    "pg_trgm is not available, location search by hierarchy "
+                    "will not be indexed."
+                )
+        return super()._auto_init()
+
+    def init(self):
+        super().init()
+        # Locations the order analysis report refreshes the orders of
+        tools.create_index(
+            self.env.cr, "fsm_location_write_date_index", self._table, ["write_date"]
+        )
+
+    @api.model
+    def name_search(self, name="", args=None, operator="ilike", limit=100):
+        """Rank the locations matching ``name`` on ``complete_name`` by
+        trigram similarity, so the closest match comes first."""
+        if not name or operator != "ilike" or not self.env.registry.has_trigram:
+            return super().name_search(
+                name=name, args=args, operator=operator, limit=limit
+            )
+        domain = expression.AND([args or [], [("complete_name", "ilike", name)]])
+        query = self._search(domain, limit=limit)
+        query.order = SQL(
+            "similarity(%s, %s) DESC, %s",
+            SQL.identifier(self._table, "complete_name"),
+            name,
+            SQL.identifier(self._table, "id"),
+        )
+        locations = self.browse(query)
+        return [(location.id, location.display_name) for location in locations.sudo()]
 
     @api.model_create_multi
     def create(self, vals):
@@ -81,7 +136,18 @@ class FSMLocation(models.Model):
         res.write({"fsm_location": True})
         return res
 
-    @api.depends("partner_id.name", "fsm_parent_id.complete_name", "ref")
+    def write(self, vals):
+        if vals.get("fsm_parent_id"):
+            parent = self.browse(vals["fsm_parent_id"])
+            if set(parent._get_ancestor_ids()) & set(self.ids):
+                raise ValidationError(_("You cannot create recursive location."))
+        res = super().write(vals)
+        # name and ref are propagated by res.partner.write()
+        if {"fsm_parent_id", "direction"} & vals.keys():
+            self._update_subtree_complete_names()
+        return res
+
+    @api.depends("partner_id.name", "fsm_parent_id", "ref")
     def _compute_complete_name(self):
         for loc in self:
             if loc.fsm_parent_id:
@@ -100,13 +166,73 @@ class FSMLocation(models.Model):
                 else:
                     loc.complete_name = loc.partner_id.name
 
-    @api.depends("direction", "fsm_parent_id.complete_direction")
+    @api.depends("direction", "fsm_parent_id")
     def _compute_complete_direction(self):
         for rec in self:
             parent_direction = rec.fsm_parent_id.complete_direction
             complete_direction = (parent_direction or "") + (rec.direction or "")
             rec.complete_direction = complete_direction or False
 
+    def _update_subtree_complete_names(self):
+        """Propagate ``complete_name`` and ``complete_direction`` of ``self``
+        to all their sub-locations.
+
+        The whole subtree is rewritten by a single recursive update mirroring
+        ``_compute_complete_name`` and ``_compute_complete_direction``, and
+        only the rows that actually changed are invalidated from the cache.
+        """
+        if not self:
+            return
+        self.flush_recordset(["complete_name", "complete_direction"])
+        self.flush_model(["fsm_parent_id", "direction", "partner_id"])
+        self.env["res.partner"].flush_model(["name", "ref"])
+        self.env.cr.execute(
+            """
+            WITH RECURSIVE subtree(id, complete_name, complete_direction) AS (
+                SELECT loc.id, loc.complete_name, loc.complete_direction
+                FROM fsm_location loc
+                WHERE loc.id IN %(ids)s
+              UNION ALL
+                SELECT child.id,
+                    subtree.complete_name || ' / '
+                    || CASE WHEN COALESCE(partner.ref, '') != ''
+                        THEN '[' || partner.ref || '] ' ELSE '' END
+                    || COALESCE(partner.name, ''),
+                    NULLIF(
+                        COALESCE(subtree.complete_direction, '')
+                        || COALESCE(child.direction, ''),
+                        ''
+                    )
+                FROM fsm_location child
+                JOIN subtree ON child.fsm_parent_id = subtree.id
+                JOIN res_partner partner ON partner.id = child.partner_id
+                WHERE child.id NOT IN %(ids)s
+            )
+            UPDATE fsm_location loc
+            SET complete_name = subtree.complete_name,
+                complete_direction = subtree.complete_direction,
+                write_uid = %(uid)s, write_date = %(write_date)s
+            FROM subtree
+            WHERE loc.id = subtree.id
+                AND loc.id NOT IN %(ids)s
+                AND (
+                    loc.complete_name IS DISTINCT FROM subtree.complete_name
+                    OR loc.complete_direction
+                        IS DISTINCT FROM subtree.complete_direction
+                )
+            RETURNING loc.id
+            """,
+            {
+                "ids": tuple(self.ids),
+                "uid": self.env.uid,
+                "write_date": self.env.cr.now(),
+            },
+        )
+        updated = self.browse(row[0] for row in self.env.cr.fetchall())
+        updated.invalidate_recordset(
+            ["complete_name", "complete_direction", "write_uid", "write_date"]
+        )
+
     @api.onchange("fsm_parent_id")
     def _onchange_fsm_parent_id(self):
         self.owner_id = self.fsm_parent_id.owner_id or False
@@ -149,77 +275,23 @@ class FSMLocation(models.Model):
 
     def comp_count(self, contact, equipment, loc):
         if equipment:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                equip = self.env["fsm.equipment"].search_count(
-                    [("location_id", "=", child.id)]
-                )
-            if child_locs:
-                for loc in child_locs:
-                    equip += loc.comp_count(0, 1, loc)
-            return equip
+            return self.env["fsm.equipment"].search_count(
+                loc._subtree_domain("location_id")
+            )
         elif contact:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                con = self.env["res.partner"].search_count(
-                    [("service_location_id", "=", child.id)]
-                )
-            if child_locs:
-                for loc in child_locs:
-                    con += loc.comp_count(1, 0, loc)
-            return con
-        else:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                subloc = self.env["fsm.location"].search_count(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-            if child_locs:
-                for loc in child_locs:
-                    subloc += loc.comp_count(0, 0, loc)
-            return subloc
+            return self.env["res.partner"].search_count(
+                loc._subtree_domain("service_location_id")
+            )
+        return self.search_count(loc._subtree_domain(include_self=False))
 
     def get_action_views(self, contact, equipment, loc):
         if equipment:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                equip = self.env["fsm.equipment"].search(
-                    [("location_id", "=", child.id)]
-                )
-            if child_locs:
-                for loc in child_locs:
-                    equip += loc.get_action_views(0, 1, loc)
-            return equip
+            return self.env["fsm.equipment"].search(loc._subtree_domain("location_id"))
         elif contact:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                con = self.env["res.partner"].search(
-                    [("service_location_id", "=", child.id)]
-                )
-            if child_locs:
-                for loc in child_locs:
-                    con += loc.get_action_views(1, 0, loc)
-            return con
-        else:
-            for child in loc:
-                child_locs = self.env["fsm.location"].search(
-                    [("fsm_parent_id", "=", child.id)]
-                )
-                subloc = child_locs
-            if child_locs:
-                for loc in child_locs:
-                    subloc += loc.get_action_views(0, 0, loc)
-            return subloc
+            return self.env["res.partner"].search(
+                loc._subtree_domain("service_location_id")
+            )
+        return self.search(loc._subtree_domain(include_self=False))
 
     def action_view_contacts(self):
         """
@@ -246,9 +318,9 @@ class FSMLocation(models.Model):
             return action
 
     def _compute_contact_ids(self):
+        counts = self._read_subtree_counts("res.partner", "service_location_id")
         for loc in self:
-            contacts = self.comp_count(1, 0, loc)
-            loc.contact_count = contacts
+            loc.contact_count = counts.get(loc._origin.id, 0)
 
     def action_view_equipment(self):
         """
@@ -277,8 +349,9 @@ class FSMLocation(models.Model):
             return action
 
     def _compute_sublocation_ids(self):
+        counts = self._read_subtree_counts("fsm.location", "fsm_parent_id")
         for loc in self:
-            loc.sublocation_count = self.comp_count(0, 0, loc)
+            loc.sublocation_count = counts.get(loc._origin.id, 0)
 
     def action_view_sublocation(self):
         """
@@ -310,8 +383,9 @@ class FSMLocation(models.Model):
         return self.partner_id.geo_localize()
 
     def _compute_equipment_ids(self):
+        counts = self._read_subtree_counts("fsm.equipment", "location_id")
         for loc in self:
-            loc.equipment_count = self.comp_count(0, 1, loc)
+            loc.equipment_count = counts.get(loc._origin.id, 0)
 
     @api.constrains("fsm_parent_id")
     def _check_location_recursion(self):
@@ -1,6 +1,9 @@
 # Copyright 2022 Tecnativa - Víctor Martínez
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
 from odoo import api, fields, models
 
 
@@ -22,24 +25,51 @@ class FsmModelMixin(models.AbstractModel):
 
     @api.model
     def _read_group_stage_ids(self, stages, domain):
-        return self.env["fsm.stage"].search([("stage_type", "=", self._stage_type)])
+        return self.env["fsm.stage"].browse(
+            stage_id for __, stage_id in self._get_ordered_stages()
+        )
 
     def _default_stage_id(self):
-        return self.env["fsm.stage"].search(
-            [("stage_type", "=", self._stage_type)], limit=1
+        ordered = self._get_ordered_stages()
+        return self.env["fsm.stage"].browse(ordered[0][1] if ordered else ())
+
+    @api.model
+    def _get_ordered_stages(self):
+        """Return the ``(sequence, id)`` of the stages of the model, in order"""
+        return self.env["fsm.stage"]._get_ordered_stage_ids(
+            self._stage_type, tuple(self.env.companies.ids)
         )
 
+    def _move_stages(self, targets):
+        """Write the stages of ``targets`` (record: stage id or None) with
+        one write per target stage, hiding the records reaching the last
+        stage. Records without a target keep their stage."""
+        ordered = self._get_ordered_stages()
+        last_id = ordered[-1][1] if ordered else None
+        groups = defaultdict(list)
+        for record, stage_id in targets.items():
+            if stage_id:
+                groups[stage_id].append(record.id)
+        for stage_id, ids in groups.items():
+            self.browse(ids).write({"stage_id": stage_id, "hide": stage_id == last_id})
+
     def new_stage(self, operator):
-        seq = self.stage_id.sequence
-        order_by = "asc" if operator == ">" else "desc"
-        new_stage = self.env["fsm.stage"].search(
-            [("stage_type", "=", self._stage_type), ("sequence", operator, seq)],
-            order=f"sequence {order_by}",
-            limit=1,
-        )
-        if new_stage:
-            self.stage_id = new_stage
-            self._onchange_stage_id()
+        """Move each record to the closest stage after (``>``) or before
+        (``<``) its current one, the records already on the first or last
+        stage are left as they are."""
+        ordered = self._get_ordered_stages()
+        sequences = [sequence for sequence, __ in ordered]
+        targets = {}
+        for record in self:
+            sequence = record.stage_id.sequence
+            if operator == ">":
+                index = bisect_right(sequences, sequence)
+                found = index < len(ordered)
+            else:
+                index = bisect_left(sequences, sequence) - 1
+                found = index >= 0
+            targets[record] = ordered[index][1] if found else None
+        self._move_stages(targets)
 
     def next_stage(self):
         self.new_stage(">")
@@ -47,10 +77,14 @@ class FsmModelMixin(models.AbstractModel):
     def previous_stage(self):
         self.new_stage("<")
 
+    def last_stage(self):
+        ordered = self._get_ordered_stages()
+        if ordered:
+            self._move_stages({record: ordered[-1][1] for record in self})
+
     @api.onchange("stage_id")
     def _onchange_stage_id(self):
-        # get last stage
-        heighest_stage = self.env["fsm.stage"].search(
-            [("stage_type", "=", self._stage_type)], order="sequence desc", limit=1
-        )
-        self.hide = self.stage_id.name == heighest_stage.name
+        ordered = self._get_ordered_stages()
+        last_id = ordered[-1][1] if ordered else None
+        for record in self:
+            record.hide = record.stage_id.id == last_id
@@ -1,14 +1,70 @@
 # Copyright (C) 2018 Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import hashlib
+import json
+import math
 import warnings
+from bisect import bisect_left
+from collections import defaultdict
 from datetime import datetime, timedelta
 
-from odoo import Command, _, api, fields, models
+import numpy as np
+
+from odoo import Command, _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
+from odoo.osv import expression
+from odoo.tools import SQL, split_every
 
 from . import fsm_stage
 
+FSM_REF_XMLIDS = {
+    "stage_completed": "fieldservice.fsm_stage_completed",
+    "stage_cancelled": "fieldservice.fsm_stage_cancelled",
+    "mt_order_completed": "fieldservice.mt_order_completed",
+    "mt_order_cancelled": "fieldservice.mt_order_cancelled",
+}
+
+# Open orders, written the way the ORM compiles ("is_closed", "=", False) so
+# that the partial indexes on open orders serve ORM domains and SQL queries
+OPEN_ORDER_PREDICATE = "(is_closed IS NULL OR is_closed = FALSE)"
+
+
+def open_order_sql(alias):
+    """Return the condition of the open orders of the ``alias`` table, see
+    ``OPEN_ORDER_PREDICATE``"""
+    column = SQL.identifier(alias, "is_closed")
+    return SQL("(%s IS NULL OR %s = FALSE)", column, column)
+
+
+# Weights of the soft criteria of the auto-dispatch, skills and availability
+# are hard requirements
+DISPATCH_WEIGHTS = {"territory": 2.0, "load": 1.0}
+
+# Granularity (minutes) and default horizon (days) of the slotting engine
+SLOT_MINUTES = 15
+SLOT_HORIZON_DAYS = 14
+
+CALENDAR_FEED_FIELDS = [
+    "id",
+    "name",
+    "person_id",
+    "scheduled_date_start",
+    "scheduled_date_end",
+    "stage_id",
+    "location_id",
+    "priority",
+]
+
+SLA_STATES = [
+    ("ok", "On Time"),
+    ("at_risk", "At Risk"),
+    ("breached", "Breached"),
+]
+# Orders flagged by the SLA monitor get their activity created that many at a
+# time
+SLA_ACTIVITY_BATCH = 1000
+
 
 class FSMOrder(models.Model):
     _name = "fsm.order"
@@ -58,15 +114,30 @@ class FSMOrder(models.Model):
         """Get stage color"""
         self.custom_color = self.stage_id.custom_color or "#FFFFFF"
 
+    @api.model
+    @tools.ormcache()
+    def _get_fsm_ref_ids(self):
+        """Return the ids of the stages and subtypes driving the order
+        workflow, resolved once per registry.
+
+        The cache is cleared on module update and when a stage or a subtype
+        is written or deleted, see ``fsm.stage`` and ``mail.message.subtype``.
+        """
+        IrModelData = self.env["ir.model.data"]
+        return {
+            key: IrModelData._xmlid_to_res_id(xmlid, raise_if_not_found=False)
+            for key, xmlid in FSM_REF_XMLIDS.items()
+        }
+
     def _track_subtype(self, init_values):
         self.ensure_one()
         if "stage_id" in init_values:
-            if self.stage_id.id == self.env.ref("fieldservice.fsm_stage_completed").id:
-                return self.env.ref("fieldservice.mt_order_completed")
-            elif (
-                self.stage_id.id == self.env.ref("fieldservice.fsm_stage_cancelled").id
-            ):
-                return self.env.ref("fieldservice.mt_order_cancelled")
+            ref_ids = self._get_fsm_ref_ids()
+            Subtype = self.env["mail.message.subtype"]
+            if self.stage_id.id == ref_ids["stage_completed"]:
+                return Subtype.browse(ref_ids["mt_order_completed"])
+            elif self.stage_id.id == ref_ids["stage_cancelled"]:
+                return Subtype.browse(ref_ids["mt_order_cancelled"])
         return super()._track_subtype(init_values)
 
     stage_id = fields.Many2one(
@@ -78,9 +149,13 @@ class FSMOrder(models.Model):
         group_expand="_read_group_stage_ids",
         default=lambda self: self._default_stage_id(),
     )
+    # Only follows stage_id, fsm.stage.write() propagates is_closed changes
+    # of a stage to its orders in SQL
     is_closed = fields.Boolean(
         "Is closed",
-        related="stage_id.is_closed",
+        compute="_compute_is_closed",
+        store=True,
+        index=True,
     )
     priority = fields.Selection(
         fsm_stage.AVAILABLE_PRIORITIES,
@@ -136,31 +211,41 @@ class FSMOrder(models.Model):
         help="Company related to this order",
     )
 
-    def _calc_request_late(self, vals):
+    @api.model
+    def _get_request_late_buffers(self, company=None):
+        """Return the hours of buffer added to ``request_early`` per priority"""
+        company = company or self.env.company
+        return {
+            "0": company.fsm_order_request_late_lowest,
+            "1": company.fsm_order_request_late_low,
+            "2": company.fsm_order_request_late_medium,
+            "3": company.fsm_order_request_late_high,
+        }
+
+    def _calc_request_late(self, vals, buffers=None):
         if vals.get("request_early", False):
             early = fields.Datetime.from_string(vals.get("request_early"))
         else:
             early = datetime.now()
 
-        if vals.get("priority") == "0":
-            vals["request_late"] = early + timedelta(
-                hours=self.env.company.fsm_order_request_late_lowest
-            )
-        elif vals.get("priority") == "1":
-            vals["request_late"] = early + timedelta(
-                hours=self.env.company.fsm_order_request_late_low
-            )
-        elif vals.get("priority") == "2":
-            vals["request_late"] = early + timedelta(
-                hours=self.env.company.fsm_order_request_late_medium
-            )
-        elif vals.get("priority") == "3":
-            vals["request_late"] = early + timedelta(
-                hours=self.env.company.fsm_order_request_late_high
-            )
+        if buffers is None:
+            buffers = self._get_request_late_buffers()
+        hours = buffers.get(vals.get("priority"))
+        if hours is not None:
+            vals["request_late"] = early + timedelta(hours=hours)
         return vals
 
     request_late = fields.Datetime(string="Latest Request Date")
+    sla_state = fields.Selection(
+        SLA_STATES,
+        string="SLA Status",
+        default="ok",
+        readonly=True,
+        copy=False,
+        index=True,
+        help="Set by the SLA monitor on open orders getting close to or past "
+        "their latest request date",
+    )
     description = fields.Text(
         compute="_compute_description",
         precompute=True,
@@ -250,6 +335,7 @@ class FSMOrder(models.Model):
 
     @api.depends("company_id")
     def _compute_equipment_ids(self):
+        to_populate = self.browse()
         for rec in self:
             # Clear equipments that no longer match the order company
             to_remove = rec.equipment_ids.filtered(
@@ -264,12 +350,200 @@ class FSMOrder(models.Model):
                 rec.company_id.auto_populate_equipments_on_order
                 and not rec.equipment_ids
             ):
-                rec.equipment_ids = self.env["fsm.equipment"].search(
-                    [
-                        ("current_location_id", "=", rec.location_id.id),
-                        ("company_id", "=", rec.company_id.id),
-                    ]
+                to_populate |= rec
+        if to_populate:
+            equipments = to_populate._get_location_equipments()
+            for rec in to_populate:
+                rec.equipment_ids = equipments.get(
+                    (rec.location_id.id, rec.company_id.id),
+                    self.env["fsm.equipment"],
+                )
+
+    def _get_location_equipments(self):
+        """Return the equipments currently at the locations of ``self``,
+        grouped by ``(current_location_id, company_id)`` with one query."""
+        equipments = self.env["fsm.equipment"].search(
+            [
+                ("current_location_id", "in", self.location_id.ids),
+                ("company_id", "in", self.company_id.ids),
+            ]
+        )
+        return equipments.grouped(
+            lambda equipment: (
+                equipment.current_location_id.id,
+                equipment.company_id.id,
+            )
+        )
+
+    def _populate_equipment_ids(self):
+        """Set the equipments at their location on ``self``, with one write
+        per location."""
+        equipments = self._get_location_equipments()
+        groups = self.grouped(lambda order: (order.location_id.id, order.company_id.id))
+        for key, orders in groups.items():
+            if key in equipments:
+                orders.write({"equipment_ids": [Command.set(equipments[key].ids)]})
+
+    @api.model
+    def _cron_backfill_equipment_ids(self, batch_size=500):
+        """Auto-populate the equipments of the open orders created before
+        the option was enabled on their company, ``batch_size`` orders at a
+        time.
+
+        This is a one-shot job: it is enabled and triggered when the option
+        is turned on, see ``res.company.write``, and disables itself once
+        all the orders are done, so that it never refills the equipments a
+        user removed afterwards.
+        """
+        groups = self.env["fsm.equipment"]._read_group(
+            [
+                ("current_location_id", "!=", False),
+                ("company_id.auto_populate_equipments_on_order", "=", True),
+            ],
+            ["company_id"],
+            ["current_location_id:array_agg"],
+        )
+        if not groups:
+            self.env["ir.cron"]._notify_progress(done=0, remaining=0, deactivate=True)
+            return
+        # Only pick orders that will get equipments, so that each batch
+        # makes progress
+        domain = [
+            ("equipment_ids", "=", False),
+            ("is_closed", "=", False),
+        ] + expression.OR(
+            [
+                [("company_id", "=", company.id), ("location_id", "in", location_ids)]
+                for company, location_ids in groups
+            ]
+        )
+        orders = self.search(domain, order="id", limit=batch_size)
+        orders._populate_equipment_ids()
+        remaining = self.search_count(domain) if len(orders) == batch_size else 0
+        self.env["ir.cron"]._notify_progress(
+            done=len(orders), remaining=remaining, deactivate=not remaining
+        )
+
+    def _update_sla_state(self, where=None):
+        """Recompute the SLA state of the orders of ``self``, or of the
+        orders matching the SQL condition ``where`` on ``o``, in a single
+        UPDATE, and schedule an activity on each newly flagged order.
+
+        Closed orders go back to ``ok``. The orders changed get a new
+        ``write_date``, like any other write, for the incremental refresh of
+        the report.
+
+        :return: list of ``(order id, new state)`` of the orders whose state
+            changed
+        """
+        if where is None:
+            if not self.ids:
+                return []
+            where = SQL("o.id = ANY(%s)", self.ids)
+        self.flush_model(["request_late", "is_closed", "company_id", "sla_state"])
+        self.env["res.company"].flush_model(["fsm_order_sla_warning_hours"])
+        self.env.cr.execute(
+            SQL(
+                """
+                WITH flagged AS (
+                    SELECT o.id,
+                        CASE
+                            WHEN NOT %(open)s THEN 'ok'
+                            WHEN o.request_late < %(now)s THEN 'breached'
+                            WHEN o.request_late < %(now)s + make_interval(
+                                secs => COALESCE(c.fsm_order_sla_warning_hours, 0)
+                                    * 3600
+                            ) THEN 'at_risk'
+                            ELSE 'ok'
+                        END AS sla_state
+                    FROM fsm_order o
+                    LEFT JOIN res_company c ON c.id = o.company_id
+                    WHERE %(where)s
                 )
+                UPDATE fsm_order o SET sla_state = flagged.sla_state,
+                    write_uid = %(uid)s, write_date = %(write_date)s
+                FROM flagged
+                WHERE o.id = flagged.id
+                    AND o.sla_state IS DISTINCT FROM flagged.sla_state
+                RETURNING o.id, o.sla_state
+                """,
+                now=fields.Datetime.now(),
+                open=open_order_sql("o"),
+                where=where,
+                uid=self.env.uid,
+                write_date=self.env.cr.now(),
+            )
+        )
+        changed = self.env.cr.fetchall()
+        if changed:
+            self.invalidate_model(["sla_state", "write_uid", "write_date"])
+            self._schedule_sla_activities(
+                [order_id for order_id, state in changed if state != "ok"]
+            )
+        return changed
+
+    @api.model
+    def _cron_sla_monitor(self):
+        """Flag the open orders getting close to or past their latest
+        request date, and schedule an activity on each newly flagged order.
+
+        Only the open orders not breached yet whose deadline falls within
+        the largest warning delay of the companies are scanned, through the
+        ``fsm_order_sla_pending_index`` partial index.
+        """
+        changed = self._update_sla_state(
+            SQL(
+                """
+                %s
+                AND o.sla_state IS DISTINCT FROM 'breached'
+                AND o.request_late < %s + make_interval(
+                    secs => (
+                        SELECT COALESCE(MAX(fsm_order_sla_warning_hours), 0)
+                        FROM res_company
+                    ) * 3600
+                )
+                """,
+                open_order_sql("o"),
+                fields.Datetime.now(),
+            )
+        )
+        self.env["ir.cron"]._notify_progress(done=len(changed), remaining=0)
+
+    def _schedule_sla_activities(self, order_ids):
+        """Create the "to do" activities of the orders flagged by the SLA
+        monitor, ``SLA_ACTIVITY_BATCH`` orders at a time.
+
+        Activities go to the user of the assigned worker, or else to the
+        creator of the order.
+        """
+        activity_type = self.env.ref(
+            "mail.mail_activity_data_todo", raise_if_not_found=False
+        )
+        if not activity_type or not order_ids:
+            return
+        model_id = self.env["ir.model"]._get_id(self._name)
+        summaries = {"at_risk": _("SLA at risk"), "breached": _("SLA breached")}
+        # Skip the assignation e-mails, one per activity
+        Activity = self.env["mail.activity"].with_context(
+            mail_activity_quick_update=True
+        )
+        for orders in split_every(SLA_ACTIVITY_BATCH, order_ids, self.browse):
+            orders.fetch(["name", "request_late", "sla_state", "person_id"])
+            Activity.create(
+                [
+                    {
+                        "res_model_id": model_id,
+                        "res_id": order.id,
+                        "activity_type_id": activity_type.id,
+                        "summary": summaries[order.sla_state],
+                        "date_deadline": order.request_late.date(),
+                        "user_id": (
+                            order.person_id.user_ids[:1] or order.create_uid
+                        ).id,
+                    }
+                    for order in orders
+                ]
+            )
 
     @api.depends("location_id")
     def _compute_location_directions(self):
@@ -306,29 +580,100 @@ class FSMOrder(models.Model):
             ] + search_domain
         return stages.search(search_domain, order=order)
 
+    @api.depends("stage_id")
+    def _compute_is_closed(self):
+        for order in self:
+            order.is_closed = order.stage_id.is_closed
+
     @api.model_create_multi
     def create(self, vals_list):
+        new_name = _("New")
+        to_name = [vals for vals in vals_list if vals.get("name", new_name) == new_name]
+        for vals, name in zip(to_name, self._next_order_names(len(to_name))):
+            vals["name"] = name or new_name
+        buffers = self._get_request_late_buffers()
         for vals in vals_list:
-            if vals.get("name", _("New")) == _("New"):
-                vals["name"] = self.env["ir.sequence"].next_by_code("fsm.order") or _(
-                    "New"
-                )
             self._calc_scheduled_dates(vals)
             if not vals.get("request_late"):
-                vals = self._calc_request_late(vals)
-        return super().create(vals_list)
+                self._calc_request_late(vals, buffers)
+        orders = super().create(vals_list)
+        orders._update_sla_state()
+        return orders
+
+    @api.model
+    def create_bulk(self, vals_list, chunk_size=1000, commit=False):
+        """Create a large batch of orders.
+
+        The order references of the whole batch are reserved at once and the
+        orders are inserted ``chunk_size`` at a time, clearing the cache in
+        between to keep memory flat.
+
+        :param commit: commit the transaction after each chunk, so that a
+            nightly import does not run in one huge transaction. Only use it
+            from scripts or scheduled actions.
+        :return: the created orders
+        """
+        new_name = _("New")
+        to_name = [vals for vals in vals_list if vals.get("name", new_name) == new_name]
+        for vals, name in zip(to_name, self._next_order_names(len(to_name))):
+            vals["name"] = name or new_name
+        order_ids = []
+        for chunk in split_every(chunk_size, vals_list, list):
+            order_ids += self.create(chunk).ids
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            self.env.invalidate_all()
+        return self.browse(order_ids)
+
+    @api.model
+    def _next_order_names(self, count):
+        """Reserve ``count`` references from the ``fsm.order`` sequence in a
+        single round trip, instead of one ``next_by_code`` call per order.
+        """
+        if not count:
+            return []
+        sequence = (
+            self.env["ir.sequence"]
+            .sudo()
+            .search(
+                [
+                    ("code", "=", "fsm.order"),
+                    ("company_id", "in", [self.env.company.id, False]),
+                ],
+                order="company_id",
+                limit=1,
+            )
+        )
+        if not sequence:
+            return [False] * count
+        if sequence.use_date_range:
+            return [sequence._next() for __ in range(count)]
+        if sequence.implementation == "standard":
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                (f"ir_sequence_{sequence.id:03d}", count),
+            )
+            numbers = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            increment = sequence.number_increment
+            first = sequence._update_nogap(increment * count)
+            numbers = [first + increment * index for index in range(count)]
+        return [sequence.get_next_char(number) for number in numbers]
 
     is_button = fields.Boolean(default=False)
 
     def write(self, vals):
         if vals.get("stage_id", False) and vals.get("is_button", False):
             vals["is_button"] = False
-        else:
-            stage_id = self.env["fsm.stage"].browse(vals.get("stage_id"))
-            if stage_id == self.env.ref("fieldservice.fsm_stage_completed"):
-                raise UserError(_("Cannot move to completed from Kanban"))
+        elif (
+            vals.get("stage_id")
+            and vals["stage_id"] == self._get_fsm_ref_ids()["stage_completed"]
+        ):
+            raise UserError(_("Cannot move to completed from Kanban"))
         self._calc_scheduled_dates(vals)
         res = super().write(vals)
+        if {"request_late", "stage_id"} & vals.keys():
+            self._update_sla_state()
         return res
 
     def can_unlink(self):
@@ -392,15 +737,690 @@ class FSMOrder(models.Model):
     def action_complete(self):
         return self.write(
             {
-                "stage_id": self.env.ref("fieldservice.fsm_stage_completed").id,
+                "stage_id": self._get_fsm_ref_ids()["stage_completed"],
                 "is_button": True,
             }
         )
 
     def action_cancel(self):
-        return self.write(
-            {"stage_id": self.env.ref("fieldservice.fsm_stage_cancelled").id}
+        return self.write({"stage_id": self._get_fsm_ref_ids()["stage_cancelled"]})
+
+    def _set_stage_bulk(self, stage, batch_size=1000):
+        """Move ``self`` to ``stage``, ``batch_size`` orders at a time.
+
+        The transition is validated once for the whole recordset. Each chunk
+        is moved by a single untracked write, its stage change is then
+        logged with one batched creation of the tracking messages, and only
+        the orders with followers to notify go through ``_notify_thread``.
+        The chatter ends up the same as with a regular write.
+
+        Moving to the completed stage goes through the ``is_button`` flag of
+        ``action_complete``, as it is refused from a plain write, see
+        ``write``.
+        """
+        if stage.stage_type != "order":
+            raise UserError(_("Only order stages can be set on orders."))
+        if stage.team_ids:
+            wrong_team = self.filtered(
+                lambda order: order.team_id not in stage.team_ids
+            )
+            if wrong_team:
+                raise UserError(
+                    _(
+                        "Stage %(stage)s is not used by the team of orders "
+                        "%(orders)s.",
+                        stage=stage.name,
+                        orders=", ".join(wrong_team[:10].mapped("name")),
+                    )
+                )
+        vals = {"stage_id": stage.id}
+        if stage.id == self._get_fsm_ref_ids()["stage_completed"]:
+            vals["is_button"] = True
+        orders = self.filtered(lambda order: order.stage_id != stage)
+        for chunk in split_every(batch_size, orders.ids, self.browse):
+            old_stages = {order.id: order.stage_id for order in chunk}
+            chunk.with_context(mail_notrack=True).write(vals)
+            chunk._log_stage_changes(old_stages)
+        return True
+
+    def _log_stage_changes(self, old_stages):
+        """Post the stage tracking messages of ``self``, moved from the
+        stages of ``old_stages`` (a dict order id: stage) to the same stage.
+        """
+        if not self:
+            return
+        author = self.env.user.partner_id
+        subtype = self[:1]._track_subtype({"stage_id": old_stages[self[:1].id]})
+        if not subtype:
+            subtype = self.env.ref("mail.mt_note")
+        field_info = self.fields_get(
+            ["stage_id"], ["string", "type", "selection", "currency_field"]
+        )["stage_id"]
+        Tracking = self.env["mail.tracking.value"]
+        messages = (
+            self.env["mail.message"]
+            .sudo()
+            .create(
+                [
+                    {
+                        "model": self._name,
+                        "res_id": order.id,
+                        "message_type": "notification",
+                        "subtype_id": subtype.id,
+                        "author_id": author.id,
+                        "email_from": self.env.user.email_formatted,
+                        "body": "",
+                        "tracking_value_ids": [
+                            Command.create(
+                                Tracking._create_tracking_values(
+                                    old_stages[order.id],
+                                    order.stage_id,
+                                    "stage_id",
+                                    field_info,
+                                    order,
+                                )
+                            )
+                        ],
+                    }
+                    for order in self
+                ]
+            )
+        )
+        # Followers of all the orders are read at once, the author of the
+        # messages is never notified of them
+        recipients = self.env["mail.followers"]._get_recipient_data(
+            self, "notification", subtype.id
         )
+        for order, message in zip(self.sudo(), messages):
+            if set(recipients.get(order.id, ())) - {author.id}:
+                order._notify_thread(message)
+
+    def _auto_init(self):
+        # Fill the closed flag of existing orders with one UPDATE instead of
+        # computing it order by order, open orders get an explicit FALSE
+        cr = self.env.cr
+        if tools.table_exists(cr, self._table) and not tools.column_exists(
+            cr, self._table, "is_closed"
+        ):
+            tools.create_column(cr, self._table, "is_closed", "boolean")
+            cr.execute("""
+                UPDATE fsm_order o SET is_closed = COALESCE(
+                    (SELECT stage.is_closed FROM fsm_stage stage
+                     WHERE stage.id = o.stage_id),
+                    FALSE
+                )
+                """)
+        # Existing orders start with the state the monitor would give them,
+        # without an activity each. At risk orders are left to the monitor,
+        # the warning delays of the companies may not be set up yet.
+        if tools.table_exists(cr, self._table) and not tools.column_exists(
+            cr, self._table, "sla_state"
+        ):
+            tools.create_column(cr, self._table, "sla_state", "varchar")
+            cr.execute(
+                SQL(
+                    """
+                    UPDATE fsm_order o SET sla_state = CASE
+                        WHEN %s AND o.request_late < %s THEN 'breached'
+                        ELSE 'ok'
+                    END
+                    """,
+                    open_order_sql("o"),
+                    fields.Datetime.now(),
+                )
+            )
+        return super()._auto_init()
+
+    def init(self):
+        tools.create_index(
+            self.env.cr,
+            "fsm_order_person_schedule_index",
+            self._table,
+            ["person_id", "scheduled_date_start"],
+        )
+        # Calendar feed, the orders overlapping a range end after its start
+        tools.create_index(
+            self.env.cr,
+            "fsm_order_person_schedule_end_index",
+            self._table,
+            ["person_id", "scheduled_date_end"],
+        )
+        # Open orders are what dispatch screens and counters look at
+        for name, columns in (
+            ("fsm_order_open_team_index", ["team_id"]),
+            ("fsm_order_open_person_index", ["person_id", "scheduled_date_start"]),
+            ("fsm_order_open_schedule_index", ["scheduled_date_start"]),
+        ):
+            tools.create_index(
+                self.env.cr, name, self._table, columns, where=OPEN_ORDER_PREDICATE
+            )
+        # Deadlines the SLA monitor still has to look at
+        tools.create_index(
+            self.env.cr,
+            "fsm_order_sla_pending_index",
+            self._table,
+            ["request_late"],
+            where=f"{OPEN_ORDER_PREDICATE} AND sla_state IS DISTINCT FROM 'breached'",
+        )
+        # Orders the analysis report refreshes: written or late since its
+        # previous run
+        tools.create_index(
+            self.env.cr, "fsm_order_write_date_index", self._table, ["write_date"]
+        )
+        tools.create_index(
+            self.env.cr,
+            "fsm_order_open_request_late_index",
+            self._table,
+            ["request_late"],
+            where=OPEN_ORDER_PREDICATE,
+        )
+
+    def _get_schedule_conflicts(self):
+        """Return the open orders of the same worker overlapping the schedule
+        of each order of ``self``.
+
+        All the windows are checked with a single range query on the
+        ``(person_id, scheduled_date_start)`` index. Values pending in the
+        cache are used, so it also works on new records in onchanges.
+
+        :return: dict mapping each conflicting order of ``self`` to the
+            orders it overlaps
+        """
+        orders = self.filtered(
+            lambda order: order.person_id
+            and order.scheduled_date_start
+            and order.scheduled_date_end
+            and not order.is_closed
+        )
+        if not orders:
+            return {}
+        self.flush_model(
+            ["person_id", "scheduled_date_start", "scheduled_date_end", "is_closed"]
+        )
+        windows = SQL(", ").join(
+            SQL(
+                "(%s, %s, %s::timestamp, %s::timestamp, %s::integer)",
+                index,
+                order.person_id.id,
+                order.scheduled_date_start,
+                order.scheduled_date_end,
+                order._origin.id or None,
+            )
+            for index, order in enumerate(orders)
+        )
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT win.index, array_agg(o.id ORDER BY o.scheduled_date_start)
+                FROM (VALUES %s)
+                    AS win(index, person_id, date_start, date_end, order_id)
+                JOIN fsm_order o
+                    ON o.person_id = win.person_id
+                    AND o.scheduled_date_start < win.date_end
+                    AND o.scheduled_date_end > win.date_start
+                    AND o.id IS DISTINCT FROM win.order_id
+                    AND %s
+                GROUP BY win.index
+                """,
+                windows,
+                open_order_sql("o"),
+            )
+        )
+        return {
+            orders[index]: self.browse(order_ids)
+            for index, order_ids in self.env.cr.fetchall()
+        }
+
+    def _get_schedule_conflict_message(self, conflicts):
+        return "\n".join(
+            _(
+                "%(worker)s is already scheduled on %(orders)s.",
+                worker=order.person_id.name,
+                orders=", ".join(others.mapped("name")),
+            )
+            for order, others in conflicts.items()
+        )
+
+    @api.constrains("person_id", "scheduled_date_start", "scheduled_date_end")
+    def _check_schedule_conflicts(self):
+        orders = self.filtered(
+            lambda order: order.company_id.fsm_order_schedule_conflict == "error"
+        )
+        conflicts = orders._get_schedule_conflicts()
+        if conflicts:
+            raise ValidationError(self._get_schedule_conflict_message(conflicts))
+
+    @api.onchange("person_id", "scheduled_date_start", "scheduled_date_end")
+    def _onchange_schedule_conflicts(self):
+        if self.company_id.fsm_order_schedule_conflict == "none":
+            return
+        conflicts = self._get_schedule_conflicts()
+        if conflicts:
+            return {
+                "warning": {
+                    "title": _("Worker double-booked"),
+                    "message": self._get_schedule_conflict_message(conflicts),
+                }
+            }
+
+    def _get_dispatch_candidates(self):
+        companies = self.company_id
+        return self.env["fsm.person"].search(
+            [("company_id", "in", companies.ids + [False])]
+        )
+
+    def _get_dispatch_matrix(self, workers, windows):
+        """Return the ``(orders, workers)`` score matrix of the auto-dispatch.
+
+        Each criterion is computed for all the pairs at once from incidence
+        matrices: territory (``res.territory.person_ids``, its primary
+        assignment and ``fsm.person.territory_ids``), skills (the worker
+        must have all the categories of the order), availability (the
+        scheduled window must be free of other open orders of the worker and
+        within its working schedule). Infeasible pairs score ``-inf``.
+        """
+        n_orders, n_workers = len(self), len(workers)
+        worker_index = {worker_id: j for j, worker_id in enumerate(workers.ids)}
+
+        territories = self.territory_id
+        territory_index = {tid: k for k, tid in enumerate(territories.ids)}
+        worker_territory = np.zeros((n_workers, len(territories)), dtype=bool)
+        for territory in territories:
+            for worker in territory.person_ids | territory.person_id:
+                if worker.id in worker_index:
+                    worker_territory[
+                        worker_index[worker.id], territory_index[territory.id]
+                    ] = True
+        for j, worker in enumerate(workers):
+            for territory in worker.territory_ids & territories:
+                worker_territory[j, territory_index[territory.id]] = True
+        order_territory = np.array(
+            [territory_index.get(order.territory_id.id, -1) for order in self],
+            dtype=int,
+        )
+        in_territory = np.zeros((n_orders, n_workers))
+        located = order_territory >= 0
+        in_territory[located] = worker_territory[:, order_territory[located]].T
+
+        categories = self.category_ids
+        category_index = {cid: k for k, cid in enumerate(categories.ids)}
+        order_skills = np.zeros((n_orders, len(categories)))
+        for i, order in enumerate(self):
+            order_skills[i, [category_index[cid] for cid in order.category_ids.ids]] = 1
+        worker_skills = np.zeros((n_workers, len(categories)))
+        for j, worker in enumerate(workers):
+            indexes = [
+                category_index[cid]
+                for cid in worker.category_ids.ids
+                if cid in category_index
+            ]
+            worker_skills[j, indexes] = 1
+        missing_skills = order_skills @ (1 - worker_skills).T
+
+        scores = DISPATCH_WEIGHTS["territory"] * in_territory
+        scores[missing_skills > 0] = -np.inf
+        scheduled, starts, ends = windows
+        if scheduled.any():
+            scores[~self._get_dispatch_availability(workers, starts, ends)] = -np.inf
+        return scores
+
+    def _get_dispatch_windows(self):
+        """Return the scheduled mask, start and end arrays of the orders"""
+        starts = np.array(
+            [order.scheduled_date_start or "NaT" for order in self],
+            dtype="datetime64[s]",
+        )
+        ends = np.array(
+            [
+                order.scheduled_date_start and order.scheduled_date_end or "NaT"
+                for order in self
+            ],
+            dtype="datetime64[s]",
+        )
+        return ~np.isnat(ends), starts, ends
+
+    def _get_dispatch_availability(self, workers, starts, ends):
+        """Return the ``(orders, workers)`` boolean matrix of the workers free
+        during the scheduled window of each order, unscheduled orders fit
+        any worker."""
+        scheduled = ~np.isnat(ends)
+        available = np.ones((len(self), len(workers)), dtype=bool)
+        date_start = starts[scheduled].min().item()
+        date_end = ends[scheduled].max().item()
+        busy = defaultdict(list)
+        for order in self.search_fetch(
+            [
+                ("person_id", "in", workers.ids),
+                ("scheduled_date_start", "<", date_end),
+                ("scheduled_date_end", ">", date_start),
+                ("is_closed", "=", False),
+            ],
+            ["person_id", "scheduled_date_start", "scheduled_date_end"],
+        ):
+            busy[order.person_id.id].append(
+                (order.scheduled_date_start, order.scheduled_date_end)
+            )
+        work_intervals = workers._get_work_intervals(date_start, date_end)
+        starts, ends = starts[scheduled, None], ends[scheduled, None]
+        for j, worker in enumerate(workers):
+            free = np.ones(len(starts), dtype=bool)
+            if busy[worker.id]:
+                busy_starts, busy_ends = np.array(
+                    busy[worker.id], dtype="datetime64[s]"
+                ).T
+                free &= ~((busy_starts < ends) & (busy_ends > starts)).any(axis=1)
+            if worker.id in work_intervals:
+                work = np.array(work_intervals[worker.id], dtype="datetime64[s]")
+                if len(work):
+                    work_starts, work_ends = work.T
+                    free &= ((work_starts <= starts) & (work_ends >= ends)).any(axis=1)
+                else:
+                    free[:] = False
+            available[scheduled, j] = free
+        return available
+
+    def _auto_dispatch(self, workers=None):
+        """Assign a worker to each unassigned open order of ``self``.
+
+        The orders are processed by priority then deadline, each one goes to
+        the feasible worker with the best score, the current load of the
+        workers (open orders assigned to them) breaking the ties. The load
+        and the availability of the chosen worker are updated in place, so
+        the whole run stays vectorized over the workers.
+
+        :param workers: candidate ``fsm.person``, by default the workers of
+            the companies of the orders
+        :return: dict mapping the dispatched orders to their worker
+        """
+        orders = self.filtered(
+            lambda order: not order.person_id and not order.is_closed
+        ).sorted(
+            lambda order: (
+                -int(order.priority),
+                order.request_late or datetime.max,
+                order.id,
+            )
+        )
+        if workers is None:
+            workers = orders._get_dispatch_candidates()
+        if not orders or not workers:
+            return {}
+        scheduled, starts, ends = windows = orders._get_dispatch_windows()
+        scores = orders._get_dispatch_matrix(workers, windows)
+        load_data = self._read_group(
+            [("person_id", "in", workers.ids), ("is_closed", "=", False)],
+            ["person_id"],
+            ["__count"],
+        )
+        counts = {person.id: count for person, count in load_data}
+        load = np.array([counts.get(worker_id, 0) for worker_id in workers.ids], float)
+        assignment = defaultdict(list)
+        for i in range(len(orders)):
+            row = scores[i] + DISPATCH_WEIGHTS["load"] / (1.0 + load)
+            j = int(np.argmax(row))
+            if row[j] == -np.inf:
+                continue
+            assignment[j].append(i)
+            load[j] += 1
+            if scheduled[i]:
+                overlap = scheduled & (starts < ends[i]) & (ends > starts[i])
+                scores[overlap, j] = -np.inf
+        result = {}
+        for j, indexes in assignment.items():
+            dispatched = self.browse([orders[i].id for i in indexes])
+            dispatched.write({"person_id": workers[j].id})
+            result.update(dict.fromkeys(dispatched, workers[j]))
+        return result
+
+    @api.model
+    def _get_slot_bitmap(self, intervals, date_from, slot_count, inner=True):
+        """Return the bitmap of the slots covered by the intervals.
+
+        Bit ``k`` stands for the slot starting ``k * SLOT_MINUTES`` after
+        ``date_from``. With ``inner``, only the slots fully inside an
+        interval are set (free time), else all the slots it touches (busy
+        time).
+        """
+        slot = timedelta(minutes=SLOT_MINUTES)
+        bitmap = 0
+        for start, stop in intervals:
+            first, last = (start - date_from) / slot, (stop - date_from) / slot
+            if inner:
+                first, last = math.ceil(first), math.floor(last)
+            else:
+                first, last = math.floor(first), math.ceil(last)
+            first, last = max(first, 0), min(last, slot_count)
+            if last > first:
+                bitmap |= ((1 << (last - first)) - 1) << first
+        return bitmap
+
+    def _get_earliest_slots(self, date_from=None, days=SLOT_HORIZON_DAYS):
+        """Return the earliest feasible start of each assigned order.
+
+        The free time of each worker (working schedule minus the open orders
+        already scheduled), the office hours of each location and the request
+        window of each order are turned into bitmaps of ``SLOT_MINUTES``
+        slots over the horizon, a single integer each. The feasible starts of
+        an order are then the bits set in ``worker & location & window``
+        followed by enough set bits to hold its duration, found with shifts
+        and a lowest-set-bit lookup. Each proposed slot is taken out of the
+        worker's bitmap before the next order, by priority then deadline.
+        The current schedules of the orders not placed yet are kept out of
+        reach, so an order that cannot be moved is never double-booked.
+
+        :return: dict mapping the orders that fit in the horizon to their
+            proposed naive UTC start
+        """
+        slot = timedelta(minutes=SLOT_MINUTES)
+        date_from = date_from or fields.Datetime.now()
+        date_from = date_from.replace(second=0, microsecond=0)
+        date_from += timedelta(minutes=-date_from.minute % SLOT_MINUTES)
+        slot_count = days * 24 * 60 // SLOT_MINUTES
+        date_to = date_from + slot_count * slot
+        full = (1 << slot_count) - 1
+        orders = self.filtered(
+            lambda order: order.person_id and not order.is_closed
+        ).sorted(
+            lambda order: (
+                -int(order.priority),
+                order.request_late or datetime.max,
+                order.id,
+            )
+        )
+        if not orders:
+            return {}
+
+        workers = orders.person_id
+        busy = defaultdict(list)
+        for order in self.search_fetch(
+            [
+                ("id", "not in", orders.ids),
+                ("person_id", "in", workers.ids),
+                ("scheduled_date_start", "<", date_to),
+                ("scheduled_date_end", ">", date_from),
+                ("is_closed", "=", False),
+            ],
+            ["person_id", "scheduled_date_start", "scheduled_date_end"],
+        ):
+            busy[order.person_id.id].append(
+                (order.scheduled_date_start, order.scheduled_date_end)
+            )
+        work_intervals = workers._get_work_intervals(date_from, date_to)
+        free = {}
+        for worker in workers:
+            bitmap = full
+            if worker.id in work_intervals:
+                bitmap = self._get_slot_bitmap(
+                    work_intervals[worker.id], date_from, slot_count
+                )
+            free[worker.id] = bitmap & ~self._get_slot_bitmap(
+                busy[worker.id], date_from, slot_count, inner=False
+            )
+        office = {
+            calendar.id: self._get_slot_bitmap(
+                calendar._get_fsm_work_intervals(date_from, date_to),
+                date_from,
+                slot_count,
+            )
+            for calendar in orders.location_id.calendar_id
+        }
+
+        # The current schedules of the orders stay booked until they are
+        # moved, so that those which cannot be placed keep their slot
+        pending = defaultdict(dict)
+        for order in orders:
+            if order.scheduled_date_start and order.scheduled_date_end:
+                pending[order.person_id.id][order] = self._get_slot_bitmap(
+                    [(order.scheduled_date_start, order.scheduled_date_end)],
+                    date_from,
+                    slot_count,
+                    inner=False,
+                )
+
+        result = {}
+        for order in orders:
+            length = max(math.ceil(order.scheduled_duration * 60 / SLOT_MINUTES), 1)
+            window = self._get_slot_bitmap(
+                [(order.request_early or date_from, order.request_late or date_to)],
+                date_from,
+                slot_count,
+            )
+            current = pending[order.person_id.id].pop(order, 0)
+            booked = 0
+            for bitmap in pending[order.person_id.id].values():
+                booked |= bitmap
+            fits = free[order.person_id.id] & ~booked & window
+            if order.location_id.calendar_id:
+                fits &= office[order.location_id.calendar_id.id]
+            # Keep the bits followed by length - 1 set bits, doubling the
+            # checked run at each step
+            run = 1
+            while run < length and fits:
+                shift = min(run, length - run)
+                fits &= fits >> shift
+                run += shift
+            if not fits:
+                free[order.person_id.id] &= ~current
+                continue
+            first = (fits & -fits).bit_length() - 1
+            result[order] = date_from + first * slot
+            free[order.person_id.id] &= ~(((1 << length) - 1) << first)
+        return result
+
+    def action_schedule_earliest(self):
+        """Schedule the orders at the earliest slot of their worker"""
+        slots = self._get_earliest_slots()
+        for order, date_start in slots.items():
+            order.write(
+                {
+                    "scheduled_date_start": date_start,
+                    "scheduled_duration": order.scheduled_duration,
+                }
+            )
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "success" if slots else "warning",
+                "message": _(
+                    "%(count)s of %(total)s orders scheduled.",
+                    count=len(slots),
+                    total=len(self),
+                ),
+            },
+        }
+
+    @api.model
+    def _get_calendar_feed_domain(self, date_start, date_end, person_ids=None):
+        """Domain of the orders overlapping the range, served by the
+        ``(person_id, scheduled_date_end)`` index"""
+        domain = [
+            ("scheduled_date_end", ">", date_start),
+            ("scheduled_date_start", "<", date_end),
+        ]
+        if person_ids is not None:
+            domain.append(("person_id", "in", person_ids))
+        return domain
+
+    @api.model
+    def _get_calendar_feed_version(self, date_start, date_end, person_ids=None):
+        """Return a version of the calendar feed of the range, computed by a
+        single aggregate query without building the feed.
+
+        It changes when an order of the range is added, removed or written,
+        when its worker or location is renamed, when its location is moved in
+        the hierarchy and when the stage legend changes.
+        """
+        self.flush_model()
+        self.env["fsm.location"].flush_model(["partner_id", "write_date"])
+        self.env["fsm.person"].flush_model(["partner_id"])
+        self.env["res.partner"].flush_model(["write_date"])
+        query = self._search(
+            self._get_calendar_feed_domain(date_start, date_end, person_ids)
+        )
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT COUNT(*), SUM(o.id), MAX(o.write_date), MAX(loc.write_date),
+                    MAX(location_partner.write_date), MAX(person_partner.write_date)
+                FROM fsm_order o
+                JOIN fsm_location loc ON loc.id = o.location_id
+                JOIN res_partner location_partner
+                    ON location_partner.id = loc.partner_id
+                LEFT JOIN fsm_person person ON person.id = o.person_id
+                LEFT JOIN res_partner person_partner
+                    ON person_partner.id = person.partner_id
+                WHERE o.id IN %s
+                """,
+                query.subselect(),
+            )
+        )
+        stage_version, __ = self.env["fsm.stage"]._get_color_legend(
+            tuple(self.env.companies.ids)
+        )
+        key = [*self.env.cr.fetchone(), stage_version, self.env.lang]
+        return hashlib.sha256(
+            json.dumps(key, default=str, separators=(",", ":")).encode()
+        ).hexdigest()[:32]
+
+    @api.model
+    def _get_calendar_feed(self, date_start, date_end, person_ids=None):
+        """Return the orders scheduled between two naive UTC datetimes as a
+        compact payload for calendar views.
+
+        Orders are rows of ``CALENDAR_FEED_FIELDS`` values, the names of the
+        workers, stages and locations they refer to are sent once each.
+        """
+        orders = self.search_fetch(
+            self._get_calendar_feed_domain(date_start, date_end, person_ids),
+            CALENDAR_FEED_FIELDS[1:],
+            order="scheduled_date_start, id",
+        )
+        orders.location_id.fetch(["complete_name"])
+        orders.stage_id.fetch(["name", "custom_color"])
+        return {
+            "fields": CALENDAR_FEED_FIELDS,
+            "orders": [
+                [
+                    order.id,
+                    order.name,
+                    order.person_id.id,
+                    fields.Datetime.to_string(order.scheduled_date_start),
+                    fields.Datetime.to_string(order.scheduled_date_end),
+                    order.stage_id.id,
+                    order.location_id.id,
+                    order.priority,
+                ]
+                for order in orders
+            ],
+            "persons": {person.id: person.name for person in orders.person_id},
+            "stages": {
+                stage.id: [stage.name, stage.custom_color] for stage in orders.stage_id
+            },
+            "locations": {
+                location.id: location.complete_name for location in orders.location_id
+            },
+        }
 
     @api.onchange("scheduled_date_end")
     def onchange_scheduled_date_end(self):
@@ -440,20 +1460,40 @@ class FSMOrder(models.Model):
         )
         return location_id.complete_direction
 
+    @api.model
+    def _get_holiday_intervals(self, date_from, date_to):
+        """Return the leaves lying within ``date_from`` and ``date_to`` as
+        ``(date_from, date_to, name)`` tuples sorted by start date."""
+        leaves = self.env["resource.calendar.leaves"].search_fetch(
+            [("date_from", ">=", date_from), ("date_to", "<=", date_to)],
+            ["date_from", "date_to", "name"],
+            order="date_from, id",
+        )
+        return [(leave.date_from, leave.date_to, leave.name) for leave in leaves]
+
     @api.constrains("scheduled_date_start")
     def check_day(self):
-        for rec in self:
-            if not rec.scheduled_date_start:
-                continue
-
-            holidays = self.env["resource.calendar.leaves"].search(
-                [
-                    ("date_from", ">=", rec.scheduled_date_start),
-                    ("date_to", "<=", rec.scheduled_date_end),
-                ]
-            )
-            if holidays:
-                msg = (
-                    f"{rec.scheduled_date_start.date()} is a holiday {holidays[0].name}"
-                )
-                raise ValidationError(_(msg))
+        orders = self.filtered("scheduled_date_start")
+        if not orders:
+            return
+        # Load the leaves of the whole batch at once, then check each order
+        # against the sorted intervals in memory
+        holidays = self._get_holiday_intervals(
+            min(orders.mapped("scheduled_date_start")),
+            max(rec.scheduled_date_end or rec.scheduled_date_start for rec in orders),
+        )
+        holiday_starts = [holiday[0] for holiday in holidays]
+        for rec in orders:
+            date_end = rec.scheduled_date_end or rec.scheduled_date_start
+            index = bisect_left(holiday_starts, rec.scheduled_date_start)
+            for date_from, date_to, name in holidays[index:]:
+                if date_from > date_end:
+                    break
+                if date_to <= date_end:
+                    raise ValidationError(
+                        _(
+                            "%(date)s is a holiday %(name)s",
+                            date=rec.scheduled_date_start.date(),
+                            name=name,
+                        )
+                    )
@@ -0,0 +1,104 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models, tools
+from odoo.osv import expression
+from odoo.tools import SQL
+from odoo.tools.sql import make_index_name
+
+
+class FsmParentStoreMixin(models.AbstractModel):
+    """Subtree helpers for the hierarchical models using ``_parent_store``.
+
+    ``child_of`` is resolved on the materialized ``parent_path``, so a whole
+    subtree is selected with a single ``parent_path LIKE 'x/%'`` query, and
+    the ancestors of a record are read from it without any query.
+    """
+
+    _name = "fsm.parent.store.mixin"
+    _description = "Field Service Hierarchy Mixin"
+
+    def init(self):
+        super().init()
+        if self._abstract or not self._parent_store:
+            return
+        # The ORM gives parent_path a plain btree index, which only serves
+        # the prefix LIKE of child_of in the C locale: replace it by one
+        # using the pattern operator class, which serves equality as well.
+        index_name = make_index_name(self._table, "parent_path")
+        self.env.cr.execute(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = %s", [index_name]
+        )
+        row = self.env.cr.fetchone()
+        if row and "text_pattern_ops" not in row[0]:
+            self.env.cr.execute(SQL("DROP INDEX %s", SQL.identifier(index_name)))
+        tools.create_index(
+            self.env.cr, index_name, self._table, ["parent_path text_pattern_ops"]
+        )
+
+    def _get_ancestor_ids(self):
+        """Return the ids of ``self`` and all its parents, read from the
+        materialized ``parent_path``."""
+        self.ensure_one()
+        return [int(rec_id) for rec_id in (self.parent_path or "").split("/")[:-1]]
+
+    def _subtree_domain(self, field_name="id", include_self=True):
+        """Domain matching ``field_name`` against ``self`` and all the
+        records below it."""
+        domain = [(field_name, "child_of", self.ids)]
+        if not include_self:
+            domain.append((field_name, "not in", self.ids))
+        return domain
+
+    def _read_subtree_counts(self, model_name, field_name, domain=None):
+        """Count the ``model_name`` records linked through ``field_name`` to
+        each record of ``self`` or to one of the records below it.
+
+        The whole recordset is served by one grouped query; the totals of
+        each linked record are then rolled up in memory to all its ancestors
+        using ``parent_path``. Grouping the model itself by its parent field
+        counts every record below each ancestor.
+
+        :return: dict mapping ids to their subtree count
+        """
+        counts = dict.fromkeys(self.ids, 0)
+        if not counts:
+            return counts
+        groups = self.env[model_name]._read_group(
+            expression.AND([domain or [], self._subtree_domain(field_name)]),
+            [field_name],
+            ["__count"],
+        )
+        for record, count in groups:
+            if not record:
+                continue
+            for ancestor_id in record._get_ancestor_ids():
+                if ancestor_id in counts:
+                    counts[ancestor_id] += count
+        return counts
+
+    def _read_subtree_ids(self, model_name, field_name, domain=None):
+        """Collect the ids of the ``model_name`` records linked through
+        ``field_name`` to each record of ``self`` or to one of the records
+        below it.
+
+        Same as :meth:`_read_subtree_counts`, for the fields where a record
+        can be linked to several records of a subtree and must only be
+        counted once.
+
+        :return: dict mapping ids to sets of record ids
+        """
+        result = {rec_id: set() for rec_id in self.ids}
+        if not result:
+            return result
+        groups = self.env[model_name]._read_group(
+            expression.AND([domain or [], self._subtree_domain(field_name)]),
+            [field_name],
+            ["id:array_agg"],
+        )
+        for record, ids in groups:
+            if not record:
+                continue
+            for ancestor_id in record._get_ancestor_ids():
+                if ancestor_id in result:
+                    result[ancestor_id].update(ids)
+        return result
@@ -7,7 +7,7 @@ from odoo import api, fields, models
 class FSMPerson(models.Model):
     _name = "fsm.person"
     _inherits = {"res.partner": "partner_id"}
-    _inherit = ["mail.thread.blacklist", "fsm.model.mixin"]
+    _inherit = ["mail.thread.blacklist", "fsm.model.mixin", "fsm.geo.mixin"]
     _description = "Field Service Worker"
     _stage_type = "worker"
 
@@ -35,51 +35,68 @@ class FSMPerson(models.Model):
         return super().toggle_active()
 
     @api.model
-    def _search(
-        self,
-        args,
-        offset=0,
-        limit=None,
-        order=None,
-    ):
-        res = super()._search(
-            args,
+    def _search(self, domain, offset=0, limit=None, order=None):
+        return super()._search(
+            self._rewrite_location_ids_domain(domain),
             offset=offset,
             limit=limit,
             order=order,
         )
-        # Check for args first having location_ids as default filter
-        for arg in args:
-            if isinstance(args, (list)):
-                if arg[0] == "location_ids":
-                    # If given int search ID, else search name
-                    if isinstance(arg[2], int):
-                        self.env.cr.execute(
-                            "SELECT person_id "
-                            "FROM fsm_location_person "
-                            "WHERE location_id=%s",
-                            (arg[2],),
-                        )
-                    else:
-                        arg_2 = "%" + arg[2] + "%"
-                        self.env.cr.execute(
-                            "SELECT id "
-                            "FROM fsm_location "
-                            "WHERE complete_name like %s",
-                            (arg_2,),
-                        )
-                        location_ids = self.env.cr.fetchall()
-                        if location_ids:
-                            location_ids = [location[0] for location in location_ids]
-                            self.env.cr.execute(
-                                "SELECT DISTINCT person_id "
-                                "FROM fsm_location_person "
-                                "WHERE location_id in %s",
-                                [tuple(location_ids)],
-                            )
-                    workers_ids = self.env.cr.fetchall()
-                    return self.browse(workers_ids)._as_query()
-        return res
+
+    @api.model
+    def _rewrite_location_ids_domain(self, domain):
+        """Map ``location_ids`` leaves on the linked ``fsm.location``.
+
+        An id, a list of ids or a ``child_of`` match the location itself, a
+        name matches its ``complete_name``. The leaves are compiled by the ORM
+        as subqueries of the main query, so the rest of the domain, paging
+        and ordering still apply.
+        """
+        if not isinstance(domain, list):
+            return domain
+        result = []
+        for leaf in domain:
+            if (
+                isinstance(leaf, (list, tuple))
+                and len(leaf) == 3
+                and leaf[0] == "location_ids"
+            ):
+                __, operator, value = leaf
+                if isinstance(value, str):
+                    if operator == "=":
+                        operator = "like"
+                    leaf = ("location_ids.location_id.complete_name", operator, value)
+                elif value is not False and operator in (
+                    "=",
+                    "!=",
+                    "in",
+                    "not in",
+                    "child_of",
+                    "parent_of",
+                ):
+                    leaf = ("location_ids.location_id", operator, value)
+            result.append(leaf)
+        return result
+
+    def _get_work_intervals(self, date_start, date_end):
+        """Return the working intervals of the workers between two naive UTC
+        datetimes.
+
+        The intervals are computed once per working schedule, leaves
+        included. Workers without working schedule are left out of the
+        result, they are considered always available.
+
+        :return: dict mapping worker ids to sorted lists of naive UTC
+            ``(start, stop)`` tuples
+        """
+        result = {}
+        for calendar, persons in (
+            self.filtered("calendar_id").grouped("calendar_id").items()
+        ):
+            slots = calendar._get_fsm_work_intervals(date_start, date_end)
+            for person in persons:
+                result[person.id] = slots
+        return result
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -1,11 +1,35 @@
 # Copyright (C) 2018 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import _, api, fields, models
+import hashlib
+import json
+from contextlib import contextmanager
+
+import psycopg2
+
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
 
 AVAILABLE_PRIORITIES = [("0", "Normal"), ("1", "Low"), ("2", "High"), ("3", "Urgent")]
 
+# Active stages of a type must have distinct sequences within a company, the
+# stages shared by all the companies among themselves. An exclusion
+# constraint is used as it can be both partial and deferrable, so that stages
+# can swap their sequences within a transaction, see web_resequence().
+STAGE_SEQUENCE_CONSTRAINT = "fsm_stage_type_sequence_uniq"
+
+# Fields read by the stage caches, see _get_ordered_stage_ids() and
+# _get_color_legend()
+STAGE_CACHED_FIELDS = {
+    "sequence",
+    "name",
+    "stage_type",
+    "company_id",
+    "active",
+    "custom_color",
+}
+
 
 class FSMStage(models.Model):
     _name = "fsm.stage"
@@ -65,37 +89,192 @@ class FSMStage(models.Model):
         default=lambda self: self._default_team_ids(),
     )
 
+    _sql_constraints = [
+        (
+            "type_sequence_uniq",
+            "EXCLUDE USING btree "
+            "(stage_type WITH =, (COALESCE(company_id, 0)) WITH =, sequence WITH =) "
+            "WHERE (active IS TRUE) DEFERRABLE INITIALLY IMMEDIATE",
+            "An active FSM Stage of the same Type already has this Sequence.",
+        )
+    ]
+
+    @api.model
+    @tools.ormcache("stage_type", "company_ids")
+    def _get_ordered_stage_ids(self, stage_type, company_ids):
+        """Return the ``(sequence, id)`` of the active stages of a type that
+        are visible from the companies, in the order of the stages.
+
+        The result is cached per registry and is cleared when stages are
+        created, deleted, or written on the fields ordering them.
+        """
+        stages = (
+            self.sudo()
+            .with_context(active_test=True)
+            .search_fetch(
+                [
+                    ("stage_type", "=", stage_type),
+                    ("company_id", "in", [*company_ids, False]),
+                ],
+                ["sequence"],
+            )
+        )
+        return tuple((stage.sequence, stage.id) for stage in stages)
+
+    @api.model
+    @tools.ormcache("company_ids")
+    def _get_color_legend(self, company_ids):
+        """Return the ``(version, stages)`` of the color legend of the stages
+        visible from the companies, ``stages`` being the ``(id, name, color)``
+        of the stages in order and ``version`` a hash of them.
+
+        The result is cached per registry and is cleared with the stage
+        cache, see ``_get_ordered_stage_ids``.
+        """
+        stages = self.sudo().search_fetch(
+            [("company_id", "in", [*company_ids, False])], ["name", "custom_color"]
+        )
+        legend = tuple((stage.id, stage.name, stage.custom_color) for stage in stages)
+        version = hashlib.sha256(
+            json.dumps(legend, separators=(",", ":")).encode()
+        ).hexdigest()[:32]
+        return version, legend
+
     def get_color_information(self):
-        # get stage ids
-        stage_ids = self.search([])
-        color_information_dict = []
-        for stage in stage_ids:
-            color_information_dict.append(
-                {
-                    "color": stage.custom_color,
-                    "field": "stage_id",
-                    "opt": "==",
-                    "value": stage.name,
-                }
+        __, legend = self._get_color_legend(tuple(self.env.companies.ids))
+        return [
+            {"color": color, "field": "stage_id", "opt": "==", "value": name}
+            for __, name, color in legend
+        ]
+
+    def _get_duplicate_sequence_error(self):
+        return ValidationError(
+            _(
+                "Cannot create FSM Stage because "
+                "it has the same Type and Sequence "
+                "of an existing FSM Stage."
             )
-        return color_information_dict
+        )
+
+    @contextmanager
+    def _map_duplicate_sequence(self):
+        """Turn a violation of the sequence constraint, raised when concurrent
+        transactions create the same stage, into a ValidationError"""
+        try:
+            with self.env.cr.savepoint(flush=False):
+                yield
+        except psycopg2.errors.ExclusionViolation as error:
+            if error.diag.constraint_name != STAGE_SEQUENCE_CONSTRAINT:
+                raise
+            raise self._get_duplicate_sequence_error() from None
+
+    @api.model
+    def _check_duplicate_sequences(self, vals_list):
+        """Reject the active stages of ``vals_list`` sharing their type,
+        company and sequence with each other or with an existing active
+        stage, with a single lookup on the index of the constraint."""
+        defaults = self.default_get(["stage_type", "company_id", "sequence", "active"])
+        keys = [
+            (
+                vals.get("stage_type", defaults.get("stage_type")),
+                vals.get("company_id", defaults.get("company_id")) or 0,
+                vals.get("sequence", defaults.get("sequence")),
+            )
+            for vals in vals_list
+            if vals.get("active", defaults.get("active", True))
+        ]
+        if not keys:
+            return
+        if len(set(keys)) < len(keys):
+            raise self._get_duplicate_sequence_error()
+        self.flush_model(["stage_type", "company_id", "sequence", "active"])
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT 1 FROM fsm_stage
+                WHERE active IS TRUE
+                    AND (stage_type, COALESCE(company_id, 0), sequence) IN %s
+                LIMIT 1
+                """,
+                tuple(keys),
+            )
+        )
+        if self.env.cr.rowcount:
+            raise self._get_duplicate_sequence_error()
 
     @api.model_create_multi
     def create(self, vals_list):
-        stages = self.search([])
-        for vals in vals_list:
-            for stage in stages:
-                if stage.stage_type == vals.get(
-                    "stage_type"
-                ) and stage.sequence == vals.get("sequence"):
-                    raise ValidationError(
-                        _(
-                            "Cannot create FSM Stage because "
-                            "it has the same Type and Sequence "
-                            "of an existing FSM Stage."
-                        )
-                    )
-        return super().create(vals_list)
+        self._check_duplicate_sequences(vals_list)
+        with self._map_duplicate_sequence():
+            stages = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return stages
+
+    def write(self, vals):
+        # The stage caches are shared with the whole registry, only clear
+        # them when a value they hold actually changes
+        cached = sorted(STAGE_CACHED_FIELDS & vals.keys())
+        before = [stage[name] for stage in self for name in cached]
+        if {"sequence", "stage_type", "company_id", "active"} & vals.keys():
+            with self._map_duplicate_sequence():
+                res = super().write(vals)
+                self.flush_recordset(["stage_type", "company_id", "sequence", "active"])
+        else:
+            res = super().write(vals)
+        if before != [stage[name] for stage in self for name in cached]:
+            self.env.registry.clear_cache()
+        if "is_closed" in vals:
+            self._propagate_is_closed()
+        return res
+
+    def web_resequence(self, specification, field_name="sequence", offset=0):
+        # The stages are written one by one, the constraint is only checked
+        # once they all have their new sequence
+        self.env.cr.execute(
+            SQL(
+                "SET CONSTRAINTS %s DEFERRED", SQL.identifier(STAGE_SEQUENCE_CONSTRAINT)
+            )
+        )
+        res = super().web_resequence(specification, field_name, offset)
+        with self._map_duplicate_sequence():
+            self.env.flush_all()
+            self.env.cr.execute(
+                SQL(
+                    "SET CONSTRAINTS %s IMMEDIATE",
+                    SQL.identifier(STAGE_SEQUENCE_CONSTRAINT),
+                )
+            )
+        return res
+
+    def _propagate_is_closed(self):
+        """Copy the closed flag of the stages on their orders in one UPDATE.
+
+        Closed orders go back to the ``ok`` SLA state, reopened ones are
+        flagged again by the SLA monitor.
+        """
+        self.flush_recordset(["is_closed"])
+        self.env["fsm.order"].flush_model(["stage_id", "is_closed", "sla_state"])
+        self.env.cr.execute(
+            """
+            UPDATE fsm_order o SET is_closed = stage.is_closed,
+                sla_state = CASE WHEN stage.is_closed THEN 'ok' ELSE o.sla_state END,
+                write_uid = %s, write_date = %s
+            FROM fsm_stage stage
+            WHERE stage.id = o.stage_id
+                AND stage.id IN %s
+                AND o.is_closed IS DISTINCT FROM stage.is_closed
+            """,
+            (self.env.uid, self.env.cr.now(), tuple(self.ids)),
+        )
+        self.env["fsm.order"].invalidate_model(
+            ["is_closed", "sla_state", "write_uid", "write_date"]
+        )
+
+    def unlink(self):
+        res = super().unlink()
+        # Stages may be cached by xmlid, see fsm.order._get_fsm_ref_ids()
+        self.env.registry.clear_cache()
+        return res
 
     @api.constrains("custom_color")
     def _check_custom_color_hex_code(self):
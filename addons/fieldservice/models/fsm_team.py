@@ -1,7 +1,10 @@
 # Copyright (C) 2018 Brian McMaster
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from odoo import _, api, fields, models
+from odoo.tools import SQL
+
+from . import fsm_order
 
 
 class FSMTeam(models.Model):
@@ -12,43 +15,45 @@ class FSMTeam(models.Model):
     def _default_stages(self):
         return self.env["fsm.stage"].search([("is_default", "=", True)])
 
-    def _compute_order_count(self):
-        order_data = self.env["fsm.order"].read_group(
-            [("team_id", "in", self.ids), ("stage_id.is_closed", "=", False)],
-            ["team_id"],
-            ["team_id"],
-        )
-        result = {data["team_id"][0]: int(data["team_id_count"]) for data in order_data}
+    @api.depends_context("uid", "allowed_company_ids")
+    def _compute_order_counters(self):
+        counters = self._get_order_counters()
         for team in self:
-            team.order_count = result.get(team.id, 0)
+            (
+                team.order_count,
+                team.order_need_assign_count,
+                team.order_need_schedule_count,
+            ) = counters.get(team.id, (0, 0, 0))
 
-    def _compute_order_need_assign_count(self):
-        order_data = self.env["fsm.order"].read_group(
-            [
-                ("team_id", "in", self.ids),
-                ("person_id", "=", False),
-                ("stage_id.is_closed", "=", False),
-            ],
-            ["team_id"],
-            ["team_id"],
-        )
-        result = {data["team_id"][0]: int(data["team_id_count"]) for data in order_data}
-        for team in self:
-            team.order_need_assign_count = result.get(team.id, 0)
+    @api.model
+    def _get_order_counters(self):
+        """Return the open, unassigned and unscheduled order counts of all
+        the teams, computed with a single query.
 
-    def _compute_order_need_schedule_count(self):
-        order_data = self.env["fsm.order"].read_group(
-            [
-                ("team_id", "in", self.ids),
-                ("scheduled_date_start", "=", False),
-                ("stage_id.is_closed", "=", False),
-            ],
-            ["team_id"],
-            ["team_id"],
+        :return: dict mapping team ids to ``(open, to assign, to schedule)``
+        """
+        Order = self.env["fsm.order"]
+        Order.flush_model(["team_id", "person_id", "scheduled_date_start", "is_closed"])
+        query = Order._search([("team_id", "!=", False)])
+        # Same predicate as the partial index on the team of open orders
+        query.add_where(fsm_order.open_order_sql(query.table))
+        team = SQL.identifier(query.table, "team_id")
+        query.groupby = team
+        self.env.cr.execute(
+            query.select(
+                team,
+                SQL("COUNT(*)"),
+                SQL(
+                    "COUNT(*) FILTER (WHERE %s IS NULL)",
+                    SQL.identifier(query.table, "person_id"),
+                ),
+                SQL(
+                    "COUNT(*) FILTER (WHERE %s IS NULL)",
+                    SQL.identifier(query.table, "scheduled_date_start"),
+                ),
+            )
         )
-        result = {data["team_id"][0]: int(data["team_id_count"]) for data in order_data}
-        for team in self:
-            team.order_need_schedule_count = result.get(team.id, 0)
+        return {team_id: counts for team_id, *counts in self.env.cr.fetchall()}
 
     name = fields.Char(required=True, translate=True)
     description = fields.Text(translate=True)
@@ -65,14 +70,16 @@ class FSMTeam(models.Model):
         "fsm.order",
         "team_id",
         string="Orders",
-        domain=[("stage_id.is_closed", "=", False)],
+        domain=[("is_closed", "=", False)],
+    )
+    order_count = fields.Integer(
+        compute="_compute_order_counters", string="Orders Count"
     )
-    order_count = fields.Integer(compute="_compute_order_count", string="Orders Count")
     order_need_assign_count = fields.Integer(
-        compute="_compute_order_need_assign_count", string="Orders to Assign"
+        compute="_compute_order_counters", string="Orders to Assign"
     )
     order_need_schedule_count = fields.Integer(
-        compute="_compute_order_need_schedule_count", string="Orders to Schedule"
+        compute="_compute_order_counters", string="Orders to Schedule"
     )
     sequence = fields.Integer(default=1, help="Used to sort teams. Lower is better.")
     company_id = fields.Many2one(
@@ -85,3 +92,30 @@ class FSMTeam(models.Model):
     )
 
     _sql_constraints = [("name_uniq", "unique (name)", "Team name already exists!")]
+
+    def action_auto_dispatch(self):
+        """Assign a worker to the unassigned open orders of the teams"""
+        orders = self.env["fsm.order"].search(
+            [
+                ("team_id", "in", self.ids),
+                ("person_id", "=", False),
+                ("is_closed", "=", False),
+            ]
+        )
+        dispatched = orders._auto_dispatch()
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "type": "success" if dispatched else "warning",
+                "message": _(
+                    "%(count)s of %(total)s orders dispatched.",
+                    count=len(dispatched),
+                    total=len(orders),
+                ),
+            },
+        }
+
+    @api.model
+    def _cron_auto_dispatch(self):
+        self.search([]).action_auto_dispatch()
@@ -0,0 +1,18 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class ResBranch(models.Model):
+    _inherit = "res.branch"
+
+    def write(self, vals):
+        old_parents = None
+        if "district_id" in vals:
+            old_parents = {record.id: record.district_id.id for record in self}
+        res = super().write(vals)
+        if old_parents:
+            self.env["fsm.equipment"]._realign_territory_hierarchy(
+                "branch_id", old_parents
+            )
+        return res
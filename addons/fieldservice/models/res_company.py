@@ -30,3 +30,31 @@ class ResCompany(models.Model):
     fsm_order_request_late_high = fields.Float(
         string="Hours of Buffer for High Priority FS Orders", default=8
     )
+    fsm_order_sla_warning_hours = fields.Float(
+        string="Hours of Warning Before SLA Breach",
+        default=4,
+        help="Open orders are flagged as at risk that many hours before their "
+        "latest request date",
+    )
+    fsm_order_schedule_conflict = fields.Selection(
+        [
+            ("none", "Allow"),
+            ("warning", "Warn"),
+            ("error", "Block"),
+        ],
+        string="Worker Double-Booking",
+        default="warning",
+        help="What to do when a worker is scheduled on overlapping orders",
+    )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get("auto_populate_equipments_on_order"):
+            cron = self.env.ref(
+                "fieldservice.ir_cron_fsm_order_backfill_equipment",
+                raise_if_not_found=False,
+            )
+            if cron:
+                cron.sudo().active = True
+                cron._trigger()
+        return res
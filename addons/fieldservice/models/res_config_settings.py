@@ -110,6 +110,14 @@ class ResConfigSettings(models.TransientModel):
         related="company_id.fsm_order_request_late_high",
         readonly=False,
     )
+    fsm_order_sla_warning_hours = fields.Float(
+        related="company_id.fsm_order_sla_warning_hours",
+        readonly=False,
+    )
+    fsm_order_schedule_conflict = fields.Selection(
+        related="company_id.fsm_order_schedule_conflict",
+        readonly=False,
+    )
 
     # Dependencies
     @api.onchange("group_fsm_equipment")
@@ -0,0 +1,18 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class ResDistrict(models.Model):
+    _inherit = "res.district"
+
+    def write(self, vals):
+        old_parents = None
+        if "region_id" in vals:
+            old_parents = {record.id: record.region_id.id for record in self}
+        res = super().write(vals)
+        if old_parents:
+            self.env["fsm.equipment"]._realign_territory_hierarchy(
+                "district_id", old_parents
+            )
+        return res
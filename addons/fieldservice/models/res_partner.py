@@ -1,7 +1,7 @@
 # Copyright (C) 2018 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models
+from odoo import fields, models, tools
 
 
 class ResPartner(models.Model):
@@ -29,6 +29,18 @@ class ResPartner(models.Model):
         compute="_compute_owned_location_count", string="# of Owned Locations"
     )
 
+    def init(self):
+        super().init()
+        # Bounding box lookups of fsm.geo.mixin, partners without coordinates
+        # are stored at (0, 0)
+        tools.create_index(
+            self.env.cr,
+            "res_partner_fsm_coordinates_index",
+            self._table,
+            ["partner_latitude", "partner_longitude"],
+            where="partner_latitude != 0 OR partner_longitude != 0",
+        )
+
     def _compute_owned_location_count(self):
         for partner in self:
             partner.owned_location_count = self.env["fsm.location"].search_count(
@@ -69,4 +81,8 @@ class ResPartner(models.Model):
     def write(self, value):
         res = super().write(value)
         self._convert_fsm_location()
+        if {"name", "ref"} & value.keys():
+            self.filtered(
+                "fsm_location"
+            ).fsm_location_id._update_subtree_complete_names()
         return res
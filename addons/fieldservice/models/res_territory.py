@@ -9,3 +9,14 @@ class ResTerritory(models.Model):
 
     person_ids = fields.Many2many("fsm.person", string="Field Service Workers")
     person_id = fields.Many2one("fsm.person", string="Primary Assignment")
+
+    def write(self, vals):
+        old_parents = None
+        if "branch_id" in vals:
+            old_parents = {record.id: record.branch_id.id for record in self}
+        res = super().write(vals)
+        if old_parents:
+            self.env["fsm.equipment"]._realign_territory_hierarchy(
+                "territory_id", old_parents
+            )
+        return res
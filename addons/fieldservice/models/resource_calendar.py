@@ -0,0 +1,25 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import pytz
+
+from odoo import models
+
+
+class ResourceCalendar(models.Model):
+    _inherit = "resource.calendar"
+
+    def _get_fsm_work_intervals(self, date_start, date_end):
+        """Return the working intervals of the calendar, leaves excluded,
+        between two naive UTC datetimes as sorted naive UTC
+        ``(start, stop)`` tuples."""
+        self.ensure_one()
+        intervals = self._work_intervals_batch(
+            pytz.utc.localize(date_start), pytz.utc.localize(date_end)
+        )[False]
+        return [
+            (
+                start.astimezone(pytz.utc).replace(tzinfo=None),
+                stop.astimezone(pytz.utc).replace(tzinfo=None),
+            )
+            for start, stop, _meta in intervals
+        ]
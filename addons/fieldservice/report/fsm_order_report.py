@@ -0,0 +1,210 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import datetime, timedelta
+
+from odoo import api, fields, models, tools
+from odoo.tools import SQL
+
+from ..models import fsm_order, fsm_stage
+
+# Orders written that long before the last refresh are read again, so that
+# transactions committing late are not missed
+REFRESH_MARGIN = timedelta(minutes=5)
+REFRESH_PARAM = "fieldservice.order_report_refreshed_at"
+
+
+class FSMOrderReport(models.Model):
+    """Pre-joined order facts for the reporting views.
+
+    The data lives in a plain table filled from ``fsm_order``, refreshed
+    incrementally by a cron on the orders written since the previous run,
+    so that reporting queries neither join nor lock the live table.
+    """
+
+    _name = "fsm.order.report"
+    _description = "Field Service Order Analysis"
+    _auto = False
+    _rec_name = "name"
+    _order = "date desc, id desc"
+
+    order_id = fields.Many2one("fsm.order", string="Order", readonly=True)
+    name = fields.Char("Reference", readonly=True)
+    company_id = fields.Many2one("res.company", readonly=True)
+    team_id = fields.Many2one("fsm.team", string="Team", readonly=True)
+    stage_id = fields.Many2one("fsm.stage", string="Stage", readonly=True)
+    is_closed = fields.Boolean("Is closed", readonly=True)
+    priority = fields.Selection(fsm_stage.AVAILABLE_PRIORITIES, readonly=True)
+    type_id = fields.Many2one("fsm.order.type", string="Type", readonly=True)
+    person_id = fields.Many2one("fsm.person", string="Assigned To", readonly=True)
+    location_id = fields.Many2one("fsm.location", string="Location", readonly=True)
+    territory_id = fields.Many2one("res.territory", string="Territory", readonly=True)
+    branch_id = fields.Many2one("res.branch", string="Branch", readonly=True)
+    district_id = fields.Many2one("res.district", string="District", readonly=True)
+    region_id = fields.Many2one("res.region", string="Region", readonly=True)
+    date = fields.Date("Creation Day", readonly=True)
+    week = fields.Date("Creation Week", readonly=True)
+    scheduled_date = fields.Date("Scheduled Day", readonly=True)
+    scheduled_week = fields.Date("Scheduled Week", readonly=True)
+    nbr = fields.Integer("# of Orders", readonly=True, aggregator="sum")
+    duration = fields.Float(
+        "Actual Duration", readonly=True, aggregator="sum", help="In hours"
+    )
+    scheduled_duration = fields.Float(readonly=True, aggregator="sum")
+    duration_variance = fields.Float(
+        readonly=True,
+        aggregator="sum",
+        help="Actual minus scheduled duration of the orders done, in hours",
+    )
+    sla_breached = fields.Integer(
+        "# of SLA Breaches",
+        readonly=True,
+        aggregator="sum",
+        help="Orders done after their latest request date, or still open past it",
+    )
+
+    @api.model
+    def _select(self):
+        return SQL("""
+            SELECT
+                o.id AS id,
+                o.id AS order_id,
+                o.name AS name,
+                o.company_id AS company_id,
+                o.team_id AS team_id,
+                o.stage_id AS stage_id,
+                COALESCE(o.is_closed, FALSE) AS is_closed,
+                o.priority AS priority,
+                o.type AS type_id,
+                o.person_id AS person_id,
+                o.location_id AS location_id,
+                o.territory_id AS territory_id,
+                o.branch_id AS branch_id,
+                o.district_id AS district_id,
+                o.region_id AS region_id,
+                o.create_date::date AS date,
+                date_trunc('week', o.create_date)::date AS week,
+                o.scheduled_date_start::date AS scheduled_date,
+                date_trunc('week', o.scheduled_date_start)::date AS scheduled_week,
+                1 AS nbr,
+                COALESCE(
+                    EXTRACT(EPOCH FROM o.date_end - o.date_start) / 3600, 0
+                )::double precision AS duration,
+                COALESCE(o.scheduled_duration, 0)::double precision
+                    AS scheduled_duration,
+                CASE WHEN o.date_start IS NOT NULL AND o.date_end IS NOT NULL
+                    THEN EXTRACT(EPOCH FROM o.date_end - o.date_start) / 3600
+                        - COALESCE(o.scheduled_duration, 0)
+                    ELSE 0
+                END::double precision AS duration_variance,
+                COALESCE(
+                    CASE WHEN o.is_closed THEN o.date_end > o.request_late
+                        ELSE o.request_late < now() AT TIME ZONE 'UTC'
+                    END,
+                    FALSE
+                )::integer AS sla_breached
+            FROM fsm_order o
+            """)
+
+    def init(self):
+        # Filled once, the cron then only refreshes the orders that changed.
+        # The table is only rebuilt when its columns change.
+        cr = self.env.cr
+        select = self._select()
+        cr.execute(SQL("SELECT * FROM (%s) o LIMIT 0", select))
+        columns = {column.name for column in cr.description}
+        if tools.table_exists(cr, self._table):
+            if set(tools.table_columns(cr, self._table)) != columns:
+                cr.execute(SQL("DROP TABLE %s", SQL.identifier(self._table)))
+        if not tools.table_exists(cr, self._table):
+            self._create_table(select)
+        # Deleted orders leave the report with them, whatever deletes them
+        if not tools.get_foreign_keys(
+            cr, self._table, "id", "fsm_order", "id", "cascade"
+        ):
+            cr.execute(
+                SQL(
+                    """
+                    DELETE FROM %s report
+                    WHERE NOT EXISTS (SELECT FROM fsm_order o WHERE o.id = report.id)
+                    """,
+                    SQL.identifier(self._table),
+                )
+            )
+            tools.add_foreign_key(cr, self._table, "id", "fsm_order", "id", "cascade")
+
+    def _create_table(self, select):
+        cr = self.env.cr
+        cr.execute(SQL("CREATE TABLE %s AS %s", SQL.identifier(self._table), select))
+        cr.execute(
+            SQL("ALTER TABLE %s ADD PRIMARY KEY (id)", SQL.identifier(self._table))
+        )
+        for columns in (
+            ["company_id", "date"],
+            ["team_id", "week"],
+            ["person_id", "scheduled_week"],
+        ):
+            tools.create_index(
+                cr, f"{self._table}_{'_'.join(columns)}_index", self._table, columns
+            )
+        cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+        self.env["ir.config_parameter"].sudo().set_param(
+            REFRESH_PARAM, fields.Datetime.to_string(cr.fetchone()[0])
+        )
+
+    @api.model
+    def _cron_refresh(self):
+        """Upsert the orders written since the last refresh, those of the
+        locations written since (their territory fields follow the location)
+        and those whose latest request date passed in the meantime.
+
+        Each of these sets is selected on its own index, deleted orders are
+        removed from the report by the cascading foreign key on ``id``.
+        """
+        cr = self.env.cr
+        params = self.env["ir.config_parameter"].sudo()
+        last_refresh = fields.Datetime.to_datetime(params.get_param(REFRESH_PARAM))
+        since = last_refresh - REFRESH_MARGIN if last_refresh else datetime.min
+        self.env["fsm.order"].flush_model()
+        self.env["fsm.location"].flush_model()
+        cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+        now = cr.fetchone()[0]
+        columns = [
+            name
+            for name, field in self._fields.items()
+            if field.store and field.column_type and name != "id"
+        ]
+        cr.execute(
+            SQL(
+                """
+                WITH changed AS (
+                    SELECT o.id FROM fsm_order o WHERE o.write_date >= %(since)s
+                    UNION
+                    SELECT o.id
+                    FROM fsm_location loc
+                    JOIN fsm_order o ON o.location_id = loc.id
+                    WHERE loc.write_date >= %(since)s
+                    UNION
+                    SELECT o.id FROM fsm_order o
+                    WHERE %(open)s
+                        AND o.request_late >= %(since)s
+                        AND o.request_late < %(now)s
+                )
+                INSERT INTO %(table)s
+                %(select)s
+                WHERE o.id IN (SELECT id FROM changed)
+                ON CONFLICT (id) DO UPDATE
+                SET (%(columns)s) = (%(excluded)s)
+                """,
+                table=SQL.identifier(self._table),
+                select=self._select(),
+                since=since,
+                now=now,
+                open=fsm_order.open_order_sql("o"),
+                columns=SQL(", ").join(SQL.identifier(name) for name in columns),
+                excluded=SQL(", ").join(
+                    SQL.identifier("excluded", name) for name in columns
+                ),
+            )
+        )
+        params.set_param(REFRESH_PARAM, fields.Datetime.to_string(now))
+        self.invalidate_model()
@@ -4,8 +4,11 @@ from . import test_fsm_wizard
 from . import test_fsm_equipment
 from . import test_fsm_location
 from . import test_fsm_person
+from . import test_fsm_stage
 from . import test_fsm_team
 from . import test_fsm_order
 from . import test_fsm_order_template_onchange
 from . import test_fsm_category
 from . import test_res_partner
+from . import test_fsm_calendar_feed
+from . import test_fsm_order_report
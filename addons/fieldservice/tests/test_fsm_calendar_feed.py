@@ -0,0 +1,105 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests import HttpCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestFSMCalendarFeed(HttpCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.person = cls.env.ref("fieldservice.person_1")
+        cls.other_person = cls.env.ref("fieldservice.person_2")
+        location = cls.env.ref("fieldservice.test_location")
+        (
+            cls.order,
+            cls.other_order,
+            cls.old_order,
+            cls.long_order,
+        ) = cls.env["fsm.order"].create(
+            [
+                {
+                    "location_id": location.id,
+                    "person_id": person.id,
+                    "scheduled_date_start": start,
+                    "scheduled_duration": duration,
+                }
+                for person, start, duration in (
+                    (cls.person, datetime(2030, 1, 8, 9), 2),
+                    (cls.other_person, datetime(2030, 1, 8, 9), 2),
+                    (cls.person, datetime(2029, 12, 1, 9), 2),
+                    # Started weeks before the range, still going on
+                    (cls.person, datetime(2029, 12, 20, 9), 24 * 18 + 3),
+                )
+            ]
+        )
+        cls.url = (
+            "/fieldservice/calendar/orders?start=2030-01-07 00:00:00"
+            "&end=2030-01-14 00:00:00&person_ids=%s" % cls.person.id
+        )
+
+    def _write_later(self, records, vals):
+        # The writes of a test all share the timestamp of its transaction
+        later = self.env.cr.now() + timedelta(seconds=1)
+        with patch.object(self.env.cr, "now", lambda: later):
+            records.write(vals)
+            self.env.flush_all()
+
+    def test_calendar_feed(self):
+        self.authenticate("admin", "admin")
+        response = self.url_open(self.url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(
+            [row[0] for row in payload["orders"]], (self.long_order | self.order).ids
+        )
+        row = dict(zip(payload["fields"], payload["orders"][1]))
+        self.assertEqual(row["scheduled_date_end"], "2030-01-08 11:00:00")
+        self.assertEqual(payload["persons"], {str(self.person.id): self.person.name})
+        etag = response.headers["ETag"]
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self._write_later(self.order, {"name": "Renamed Order"})
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        # Renaming a worker changes the version as well
+        etag = response.headers["ETag"]
+        self._write_later(self.person.partner_id, {"name": "Renamed Worker"})
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["persons"], {str(self.person.id): "Renamed Worker"}
+        )
+
+    def test_calendar_feed_location_hierarchy(self):
+        self.authenticate("admin", "admin")
+        location = self.order.location_id
+        parent = self.env["fsm.location"].create(
+            {"name": "Feed Site", "owner_id": location.owner_id.id}
+        )
+        response = self.url_open(self.url)
+        etag = response.headers["ETag"]
+        # Moving the location of the orders under another one
+        self._write_later(location, {"fsm_parent_id": parent.id})
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        # Renaming an ancestor only rewrites the location in SQL
+        self._write_later(parent, {"name": "Renamed Site"})
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response.json()["locations"][str(location.id)].startswith("Renamed Site")
+        )
+
+    def test_calendar_feed_range(self):
+        self.authenticate("admin", "admin")
+        response = self.url_open(
+            "/fieldservice/calendar/orders?start=2030-01-07 00:00:00"
+            "&end=2030-06-07 00:00:00"
+        )
+        self.assertEqual(response.status_code, 400)
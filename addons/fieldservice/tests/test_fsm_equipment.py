@@ -1,6 +1,7 @@
 # Copyright (C) 2019 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from odoo.exceptions import ValidationError
 from odoo.tests import Form
 from odoo.tests.common import TransactionCase
 
@@ -66,3 +67,108 @@ class FSMEquipment(TransactionCase):
             )
         )
         self.assertTrue(data, "It should be able to read group")
+
+    def test_fsm_equipment_batched_stages(self):
+        stage_1 = self.env.ref("fieldservice.equipment_stage_1")
+        stage_2 = self.env.ref("fieldservice.equipment_stage_2")
+        stage_3 = self.env.ref("fieldservice.equipment_stage_3")
+        equipments = self.Equipment.create(
+            [
+                {"name": f"Batched Equipment {index}", "stage_id": stage.id}
+                for index, stage in enumerate((stage_1, stage_2, stage_3))
+            ]
+        )
+        equipments.next_stage()
+        self.assertEqual(
+            equipments.mapped("stage_id.id"), [stage_2.id, stage_3.id, stage_3.id]
+        )
+        self.assertEqual(equipments.mapped("hide"), [False, True, False])
+        equipments.previous_stage()
+        self.assertEqual(
+            equipments.mapped("stage_id.id"), [stage_1.id, stage_2.id, stage_2.id]
+        )
+        # A new stage is taken into account right away
+        stage_4 = self.env["fsm.stage"].create(
+            {"name": "Scrapped", "stage_type": "equipment", "sequence": 40}
+        )
+        equipments.last_stage()
+        self.assertEqual(equipments.stage_id, stage_4)
+        self.assertTrue(all(equipments.mapped("hide")))
+        # So is a resequencing
+        stage_4.sequence = 0
+        equipments.next_stage()
+        self.assertEqual(equipments.stage_id, stage_1)
+
+    def test_fsm_equipment_territory_hierarchy(self):
+        equipment = self.Equipment.create(
+            {"name": "Hierarchy Equipment", "territory_id": self.test_territory.id}
+        )
+        self.assertEqual(equipment.branch_id, self.test_branch)
+        self.assertEqual(equipment.district_id, self.test_district)
+        self.assertEqual(equipment.region_id, self.test_region)
+        equipment.territory_id = False
+        self.assertFalse(equipment.branch_id | equipment.region_id)
+        equipment.location_id = self.test_location
+        self.assertEqual(equipment.territory_id, self.test_territory)
+        self.assertEqual(equipment.region_id, self.test_region)
+        # The branch moves to another district, the equipment follow unless
+        # their district was set by hand
+        region = self.env["res.region"].create({"name": "Hierarchy Region"})
+        district, manual_district = self.env["res.district"].create(
+            [
+                {"name": "Hierarchy District", "region_id": region.id},
+                {"name": "Manual District"},
+            ]
+        )
+        manual = self.Equipment.create(
+            {
+                "name": "Manual Equipment",
+                "territory_id": self.test_territory.id,
+                "district_id": manual_district.id,
+            }
+        )
+        self.test_branch.district_id = district
+        self.assertEqual(equipment.district_id, district)
+        self.assertEqual(equipment.region_id, region)
+        self.assertEqual(manual.district_id, manual_district)
+        self.assertEqual(manual.region_id, self.test_region)
+        # The vals of the caller are left untouched
+        vals = {"territory_id": self.test_territory.id}
+        equipment.write(vals)
+        self.assertEqual(vals, {"territory_id": self.test_territory.id})
+
+    def test_fsm_equipment_subtree(self):
+        # A chain ten levels deep, with a second child under the root
+        chain = self.Equipment
+        for depth in range(10):
+            chain |= self.Equipment.create(
+                {"name": f"Level {depth}", "parent_id": chain[-1:].id}
+            )
+        root, leaf = chain[0], chain[-1]
+        sibling = self.Equipment.create({"name": "Level 1 bis", "parent_id": root.id})
+        self.assertEqual(
+            self.Equipment.search([("id", "child_of", root.id)]), chain | sibling
+        )
+        self.assertEqual(leaf._get_ancestor_ids(), chain.ids)
+        with self.assertRaises(ValidationError):
+            root.parent_id = leaf
+        order_vals = {"location_id": self.test_location.id}
+        self.env["fsm.order"].create(
+            [
+                {**order_vals, "equipment_ids": [(6, 0, (leaf | sibling).ids)]},
+                {**order_vals, "equipment_id": chain[5].id},
+                {
+                    **order_vals,
+                    "equipment_id": leaf.id,
+                    "stage_id": self.env.ref("fieldservice.fsm_stage_cancelled").id,
+                },
+            ]
+        )
+        chain.invalidate_recordset()
+        self.assertEqual(root.child_count, 2)
+        self.assertEqual(root.descendant_count, 10)
+        self.assertEqual(leaf.descendant_count, 0)
+        # The first order touches two equipment under the root
+        self.assertEqual(root.open_order_count, 2)
+        self.assertEqual(chain[6].open_order_count, 1)
+        self.assertEqual(sibling.open_order_count, 1)
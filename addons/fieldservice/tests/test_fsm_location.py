@@ -5,6 +5,8 @@ from odoo.exceptions import ValidationError
 from odoo.tests import Form
 from odoo.tests.common import TransactionCase
 
+from ..models.fsm_geo_mixin import KM_PER_DEGREE, geo_box
+
 
 class FSMLocation(TransactionCase):
     @classmethod
@@ -210,6 +212,209 @@ class FSMLocation(TransactionCase):
             (4, 3, 2, 1),
         )
 
+    def test_fsm_location_parent_path(self):
+        """Test the materialized path follows create and reparent"""
+        self.location_2.fsm_parent_id = self.location_1
+        self.location_1.fsm_parent_id = self.test_location
+        self.assertEqual(
+            self.location_2.parent_path,
+            f"{self.test_location.id}/{self.location_1.id}/{self.location_2.id}/",
+        )
+        self.assertEqual(
+            self.location_2._get_ancestor_ids(),
+            [self.test_location.id, self.location_1.id, self.location_2.id],
+        )
+        child = self.Location.create(
+            {
+                "name": "Grandchild Location",
+                "owner_id": self.test_loc_partner.id,
+                "fsm_parent_id": self.location_2.id,
+            }
+        )
+        self.assertTrue(child.parent_path.startswith(self.location_2.parent_path))
+        self.assertEqual(
+            self.Location.search(self.test_location._subtree_domain()),
+            self.test_location + self.location_1 + self.location_2 + child,
+        )
+        self.assertEqual(
+            self.Location.search(self.location_1._subtree_domain(include_self=False)),
+            self.location_2 + child,
+        )
+        # Moving a subtree rewrites the path of every descendant
+        self.location_1.fsm_parent_id = False
+        self.assertEqual(
+            child.parent_path,
+            f"{self.location_1.id}/{self.location_2.id}/{child.id}/",
+        )
+        with self.assertRaises(ValidationError):
+            self.location_1.fsm_parent_id = child
+
+    def test_fsm_location_parent_path_index(self):
+        """Test each hierarchy has a single parent_path index serving LIKE"""
+        for table in ("fsm_location", "fsm_equipment"):
+            self.env.cr.execute(
+                """
+                SELECT indexdef FROM pg_indexes
+                WHERE tablename = %s AND indexdef LIKE %s
+                """,
+                [table, "%(parent_path%"],
+            )
+            indexdefs = [row[0] for row in self.env.cr.fetchall()]
+            self.assertEqual(len(indexdefs), 1, table)
+            self.assertIn("text_pattern_ops", indexdefs[0])
+
+    def test_fsm_location_counters_query_count(self):
+        """Test subtree counters use a constant number of queries"""
+        roots = self.Location.create(
+            [
+                {"name": f"Site {i}", "owner_id": self.test_loc_partner.id}
+                for i in range(40)
+            ]
+        )
+        children = self.Location.create(
+            [
+                {
+                    "name": f"Building {i}",
+                    "owner_id": self.test_loc_partner.id,
+                    "fsm_parent_id": root.id,
+                }
+                for i, root in enumerate(roots)
+            ]
+        )
+        self.Equipment.create(
+            [
+                {"name": f"Eq-Building-{i}", "location_id": child.id}
+                for i, child in enumerate(children)
+            ]
+        )
+        self.env["res.partner"].create(
+            [
+                {"name": f"Contact {i}", "service_location_id": child.id}
+                for i, child in enumerate(children)
+            ]
+        )
+
+        def count_queries(locations):
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            for location in self.Location.browse(locations.ids):
+                self.assertEqual(
+                    (
+                        location.contact_count,
+                        location.equipment_count,
+                        location.sublocation_count,
+                    ),
+                    (1, 1, 1),
+                )
+            return self.cr.sql_log_count - start
+
+        count_queries(roots[:2])
+        self.assertEqual(count_queries(roots[:2]), count_queries(roots))
+
+    def test_fsm_location_subtree_complete_name(self):
+        """Test renaming or moving a location updates the whole subtree"""
+        self.location_2.fsm_parent_id = self.location_1
+        self.location_1.fsm_parent_id = self.test_location
+        self.assertEqual(
+            self.location_2.complete_name,
+            "Test Location / Location 1 / Location 2",
+        )
+        # Rename the root through the location and through its partner
+        self.test_location.name = "Campus"
+        self.assertEqual(
+            self.location_2.complete_name, "Campus / Location 1 / Location 2"
+        )
+        self.test_loc_partner.write({"name": "Main Campus", "ref": "MC"})
+        self.assertEqual(
+            self.location_2.complete_name,
+            "[MC] Main Campus / Location 1 / Location 2",
+        )
+        # Directions are concatenated down the tree
+        self.location_1.direction = " Gate B"
+        self.location_2.direction = " Floor 2"
+        self.assertEqual(
+            self.location_2.complete_direction,
+            "New the old inventory Gate B Floor 2",
+        )
+        # Moving the subtree rebuilds names and directions from the new parent
+        self.location_1.fsm_parent_id = self.location_3
+        self.assertEqual(
+            self.location_2.complete_name,
+            "Location 3 / Location 1 / Location 2",
+        )
+        self.assertEqual(self.location_2.complete_direction, " Gate B Floor 2")
+
+    def test_fsm_location_name_search_ranking(self):
+        """Test the closest hierarchy match is returned first"""
+        if not self.env.registry.has_trigram:
+            self.skipTest("pg_trgm is not available")
+        plant = self.Location.create(
+            {"name": "Plant North", "owner_id": self.test_loc_partner.id}
+        )
+        room = self.Location.create(
+            {
+                "name": "Boiler Room",
+                "owner_id": self.test_loc_partner.id,
+                "fsm_parent_id": plant.id,
+            }
+        )
+        boiler = self.Location.create(
+            {"name": "Boiler", "owner_id": self.test_loc_partner.id}
+        )
+        result = self.Location.name_search("Boiler")
+        self.assertEqual([row[0] for row in result[:2]], [boiler.id, room.id])
+        result = self.Location.name_search(
+            "Boiler", args=[("fsm_parent_id", "=", plant.id)]
+        )
+        self.assertEqual([row[0] for row in result], [room.id])
+
+    def test_fsm_location_geo_box(self):
+        lat_min, lat_max, lon_ranges = geo_box(45, 2, 100)
+        self.assertAlmostEqual(lat_max - lat_min, 200 / KM_PER_DEGREE)
+        self.assertEqual(len(lon_ranges), 1)
+        # Boxes crossing the antimeridian are split in two
+        __, __, lon_ranges = geo_box(64, 179.9, 50)
+        self.assertEqual(lon_ranges[0][1], 180)
+        self.assertEqual(lon_ranges[1][0], -180)
+        # Close to a pole, all the longitudes are in the box
+        self.assertEqual(geo_box(89.9, 0, 50)[2], [])
+
+    def test_fsm_location_geo_nearest(self):
+        near, far, archived = self.Location.create(
+            [
+                {
+                    "name": name,
+                    "owner_id": self.test_loc_partner.id,
+                    "partner_latitude": 64.1,
+                    "partner_longitude": longitude,
+                }
+                for name, longitude in (("Near", -21.9), ("Far", -20.0), ("Old", -21.9))
+            ]
+        )
+        archived.active = False
+        self.assertEqual(self.Location.geo_nearest(64.1, -21.95, limit=2), near | far)
+        self.assertEqual(self.Location.geo_within(64.1, -21.95, 10), near)
+        self.assertEqual(
+            self.Location.geo_nearest(64.1, -21.95, domain=[("name", "=", "Far")]), far
+        )
+        # Coordinates changes are picked up by the next query
+        near.partner_longitude = -19.0
+        self.assertEqual(self.Location.geo_nearest(64.1, -21.95), far)
+        self.assertFalse(self.Location.geo_within(64.1, -21.95, 10))
+        # The search area grows until it reaches the records
+        self.assertEqual(
+            self.Location.geo_nearest(-40, 150, domain=[("name", "=", "Far")]), far
+        )
+        east = self.Location.create(
+            {
+                "name": "East",
+                "owner_id": self.test_loc_partner.id,
+                "partner_latitude": 64.1,
+                "partner_longitude": 179.95,
+            }
+        )
+        self.assertEqual(self.Location.geo_within(64.1, -179.95, 10), east)
+
     def test_convert_partner_to_fsm_location(self):
         """
         FSM Location can be created from the res.partner form
@@ -1,7 +1,7 @@
 # Copyright (C) 2019 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from odoo import fields
 from odoo.exceptions import UserError, ValidationError
@@ -116,6 +116,413 @@ class TestFSMOrder(TransactionCase):
             )
             self.assertRegex(str(res[0]), order.name)
 
+    def test_fsm_order_create_bulk(self):
+        company = self.env.company
+        request_early = fields.Datetime.now()
+        vals_list = [
+            {
+                "location_id": self.test_location.id,
+                "priority": "1",
+                "request_early": request_early,
+            }
+            for __ in range(5)
+        ]
+        vals_list[0]["name"] = "Imported Order"
+        orders = self.Order.create_bulk(vals_list, chunk_size=2)
+        self.assertEqual(len(orders), 5)
+        self.assertEqual(orders[0].name, "Imported Order")
+        names = orders[1:].mapped("name")
+        self.assertEqual(len(set(names)), 4, "References must be unique")
+        self.assertTrue(all(name.startswith("FO") for name in names))
+        for order in orders:
+            self.assertEqual(
+                order.request_late,
+                request_early + timedelta(hours=company.fsm_order_request_late_low),
+            )
+
+        # The references of a batch are reserved in a single round trip
+        def count_queries(count):
+            start = self.cr.sql_log_count
+            self.assertEqual(len(self.Order._next_order_names(count)), count)
+            return self.cr.sql_log_count - start
+
+        count_queries(2)
+        self.assertEqual(count_queries(2), count_queries(50))
+
+    def test_fsm_order_create_bulk_query_count(self):
+        """Test a nightly import batch costs far fewer queries in bulk"""
+
+        def count_queries(create, count=200):
+            vals_list = [
+                {"location_id": self.test_location.id, "priority": str(index % 4)}
+                for index in range(count)
+            ]
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            orders = create(vals_list)
+            self.env.flush_all()
+            self.assertEqual(len(orders), count)
+            return self.cr.sql_log_count - start
+
+        one_by_one = count_queries(
+            lambda vals_list: self.Order.concat(
+                *(self.Order.create(vals) for vals in vals_list)
+            )
+        )
+        bulk = count_queries(self.Order.create_bulk)
+        self.assertLess(bulk * 2, one_by_one)
+
+    def test_fsm_order_check_day_batch(self):
+        orders = self.Order.create(
+            [{"location_id": self.test_location.id} for __ in range(3)]
+        )
+        day_start = self.p_leave.date_from.replace(hour=0, minute=0, second=0)
+        # Windows ending before the leave ends are valid
+        orders.write(
+            {
+                "scheduled_date_start": day_start,
+                "scheduled_date_end": day_start + timedelta(hours=8),
+            }
+        )
+        # A window containing the whole leave is rejected for the whole batch
+        with self.assertRaisesRegex(ValidationError, "is a holiday"):
+            orders.write(
+                {
+                    "scheduled_date_start": day_start,
+                    "scheduled_date_end": day_start + timedelta(days=2),
+                }
+            )
+
+    def test_fsm_order_backfill_equipment(self):
+        equipment = self.env["fsm.equipment"].create(
+            {"name": "Backfill Equipment", "current_location_id": self.location_1.id}
+        )
+        self.env.company.auto_populate_equipments_on_order = False
+        orders = self.Order.create(
+            [{"location_id": self.location_1.id} for __ in range(2)]
+        )
+        self.assertFalse(orders.equipment_ids)
+        cron = self.env.ref("fieldservice.ir_cron_fsm_order_backfill_equipment")
+        cron.active = False
+        self.env.company.auto_populate_equipments_on_order = True
+        self.assertTrue(cron.active, "Enabling the option starts the backfill")
+        self.Order._cron_backfill_equipment_ids()
+        for order in orders:
+            self.assertEqual(order.equipment_ids, equipment)
+        # New orders are populated in batch on create
+        orders = self.Order.create(
+            [
+                {"location_id": self.location_1.id},
+                {"location_id": self.test_location.id},
+            ]
+        )
+        self.assertEqual(orders[0].equipment_ids, equipment)
+        self.assertFalse(orders[1].equipment_ids)
+
+    def test_fsm_order_ref_ids(self):
+        ref_ids = self.Order._get_fsm_ref_ids()
+        self.assertEqual(ref_ids["stage_completed"], self.stage1.id)
+        self.assertEqual(ref_ids["stage_cancelled"], self.stage2.id)
+        self.assertEqual(
+            ref_ids["mt_order_completed"],
+            self.env.ref("fieldservice.mt_order_completed").id,
+        )
+        orders = self.Order.create(
+            [{"location_id": self.test_location.id} for __ in range(3)]
+        )
+        orders.action_complete()
+        self.assertEqual(orders.stage_id, self.stage1)
+        with self.assertRaises(UserError):
+            orders.write({"stage_id": self.stage1.id})
+        # Deleting a cached stage resets the cache
+        self.stage2.unlink()
+        self.assertFalse(self.Order._get_fsm_ref_ids()["stage_cancelled"])
+        # And so does deleting a cached subtype
+        self.env.ref("fieldservice.mt_order_cancelled").unlink()
+        self.assertFalse(self.Order._get_fsm_ref_ids()["mt_order_cancelled"])
+
+    def test_fsm_order_set_stage_bulk(self):
+        orders = self.Order.create(
+            [{"location_id": self.test_location.id} for __ in range(3)]
+        )
+        subtype = self.env.ref("fieldservice.mt_order_completed")
+        wizard = (
+            self.env["fsm.order.stage.wizard"]
+            .with_context(active_ids=orders.ids)
+            .create({"stage_id": self.stage1.id})
+        )
+        wizard.action_apply()
+        self.assertEqual(orders.stage_id, self.stage1)
+        for order in orders:
+            messages = order.message_ids.filtered(
+                lambda message: message.subtype_id == subtype
+            )
+            self.assertEqual(len(messages), 1)
+            self.assertEqual(
+                messages.tracking_value_ids.field_id.name,
+                "stage_id",
+                "The stage change should be tracked",
+            )
+        self.assertFalse(any(orders.mapped("is_button")))
+        # Other stages are plain writes
+        orders = self.Order.create(
+            [{"location_id": self.test_location.id} for __ in range(3)]
+        )
+        old_stage = orders.stage_id
+        orders[1:]._set_stage_bulk(self.stage2)
+        orders[0].write({"stage_id": self.stage2.id})
+        self.assertEqual(orders.stage_id, self.stage2)
+        self.assertFalse(any(orders.mapped("is_button")))
+        # The batched messages are the ones of a regular write
+        self.env.flush_all()
+        messages = [order.message_ids[0] for order in orders]
+        for message in messages:
+            self.assertEqual(
+                (
+                    message.subtype_id,
+                    message.author_id,
+                    message.tracking_value_ids.field_id.name,
+                    message.tracking_value_ids.old_value_integer,
+                    message.tracking_value_ids.new_value_integer,
+                ),
+                (
+                    messages[0].subtype_id,
+                    messages[0].author_id,
+                    "stage_id",
+                    old_stage.id,
+                    self.stage2.id,
+                ),
+            )
+        location_stage = self.env.ref("fieldservice.location_stage_1")
+        with self.assertRaises(UserError):
+            orders._set_stage_bulk(location_stage)
+
+        # One update and one message creation per chunk, whatever its size
+        def count_queries(count):
+            orders = self.Order.create(
+                [{"location_id": self.test_location.id} for __ in range(count)]
+            )
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            orders._set_stage_bulk(self.stage2)
+            self.env.flush_all()
+            return self.cr.sql_log_count - start
+
+        count_queries(2)
+        self.assertEqual(count_queries(2), count_queries(50))
+
+    def test_fsm_order_schedule_conflicts(self):
+        person = self.env.ref("fieldservice.person_1")
+        start = fields.Datetime.now().replace(minute=0, second=0) + timedelta(days=30)
+        order = self.Order.create(
+            {
+                "location_id": self.test_location.id,
+                "person_id": person.id,
+                "scheduled_date_start": start,
+                "scheduled_date_end": start + timedelta(hours=2),
+            }
+        )
+        vals = {
+            "location_id": self.test_location.id,
+            "person_id": person.id,
+            "scheduled_date_start": start + timedelta(hours=1),
+            "scheduled_date_end": start + timedelta(hours=3),
+        }
+        # Warn by default
+        self.env.company.fsm_order_schedule_conflict = "warning"
+        new_order = self.Order.new(vals)
+        res = new_order._onchange_schedule_conflicts()
+        self.assertIn(order.name, res["warning"]["message"])
+        other = self.Order.create(vals)
+        self.assertEqual(other._get_schedule_conflicts(), {other: order})
+        # Adjacent windows do not overlap
+        other.write(
+            {
+                "scheduled_date_start": start + timedelta(hours=2),
+                "scheduled_date_end": start + timedelta(hours=3),
+            }
+        )
+        self.assertFalse(other._get_schedule_conflicts())
+        # Block when configured
+        self.env.company.fsm_order_schedule_conflict = "error"
+        with self.assertRaises(ValidationError):
+            other.write({"scheduled_date_start": start + timedelta(hours=1)})
+        # Closed orders are not taken into account
+        order.stage_id = self.stage2
+        other.write({"scheduled_date_start": start + timedelta(hours=1)})
+
+    def test_fsm_order_is_closed(self):
+        stage = self.env["fsm.stage"].create(
+            {"name": "Waiting Parts", "stage_type": "order", "sequence": 97}
+        )
+        orders = self.Order.create(
+            [
+                {"location_id": self.test_location.id, "stage_id": stage.id}
+                for __ in range(3)
+            ]
+        )
+        self.assertFalse(any(orders.mapped("is_closed")))
+        orders[0].stage_id = self.stage2
+        self.assertTrue(orders[0].is_closed)
+        # Closing a stage closes its orders
+        stage.is_closed = True
+        self.assertEqual(orders.mapped("is_closed"), [True] * 3)
+        self.assertFalse(
+            self.Order.search([("id", "in", orders.ids), ("is_closed", "=", False)])
+        )
+        stage.is_closed = False
+        self.assertEqual(orders.mapped("is_closed"), [True, False, False])
+
+    def test_fsm_order_sla_monitor(self):
+        self.env.company.fsm_order_sla_warning_hours = 4
+        now = fields.Datetime.now()
+        late, soon, later = self.Order.create(
+            [
+                {"location_id": self.test_location.id, "request_late": deadline}
+                for deadline in (
+                    now - timedelta(hours=1),
+                    now + timedelta(hours=1),
+                    now + timedelta(days=3),
+                )
+            ]
+        )
+        self.assertEqual(
+            (late + soon + later).mapped("sla_state"), ["breached", "at_risk", "ok"]
+        )
+        # Orders created late are flagged right away
+        self.assertEqual(late.activity_ids.summary, "SLA breached")
+        self.assertEqual(soon.activity_ids.summary, "SLA at risk")
+        self.assertFalse(later.activity_ids)
+        # Time passes for the last one
+        self.env.cr.execute(
+            "UPDATE fsm_order SET request_late = %s WHERE id = %s",
+            (now + timedelta(hours=2), later.id),
+        )
+        self.Order._cron_sla_monitor()
+        self.assertEqual(later.sla_state, "at_risk")
+        activity = later.activity_ids
+        self.assertEqual(len(activity), 1)
+        self.assertEqual(activity.summary, "SLA at risk")
+        self.assertEqual(len(late.activity_ids), 1)
+        # Nothing new to flag
+        self.Order._cron_sla_monitor()
+        self.assertEqual(len(later.activity_ids), 1)
+        # Moving the deadline clears the flag
+        soon.request_late = now + timedelta(days=2)
+        self.assertEqual(soon.sla_state, "ok")
+        # Closing an order clears it as well, and it is no longer flagged
+        later.stage_id = self.stage2
+        self.assertEqual(later.sla_state, "ok")
+        later.request_late = now - timedelta(hours=1)
+        self.Order._cron_sla_monitor()
+        self.assertEqual(later.sla_state, "ok")
+        self.assertEqual(len(later.activity_ids), 1)
+        # Closing its stage resets the orders in it
+        late.stage_id.is_closed = True
+        self.assertEqual(late.sla_state, "ok")
+
+    def test_fsm_order_earliest_slots(self):
+        calendar = self.env["resource.calendar"].create(
+            {"name": "Slotting Calendar", "tz": "UTC"}
+        )
+        person = self.env["fsm.person"].create(
+            {"name": "Slotting Worker", "calendar_id": calendar.id}
+        )
+        monday = datetime(2030, 1, 7)
+        self.Order.create(
+            {
+                "location_id": self.test_location.id,
+                "person_id": person.id,
+                "scheduled_date_start": monday.replace(hour=8),
+                "scheduled_date_end": monday.replace(hour=10),
+            }
+        )
+        vals = {
+            "location_id": self.test_location.id,
+            "person_id": person.id,
+            "request_early": monday,
+            "request_late": monday.replace(hour=23),
+        }
+        long_visit, short_visit, before_noon, too_early = self.Order.create(
+            [
+                dict(vals, scheduled_duration=3),
+                dict(vals, scheduled_duration=1),
+                dict(
+                    vals,
+                    scheduled_duration=1,
+                    request_early=monday.replace(hour=11),
+                    request_late=monday.replace(hour=12),
+                ),
+                dict(vals, scheduled_duration=1, request_late=monday.replace(hour=10)),
+            ]
+        )
+        orders = long_visit | short_visit | before_noon | too_early
+        slots = orders._get_earliest_slots(monday.replace(hour=8), days=1)
+        # The earliest deadline goes first, the morning gap is too short for
+        # the long visit which waits for the afternoon
+        self.assertEqual(
+            slots,
+            {
+                before_noon: monday.replace(hour=11),
+                long_visit: monday.replace(hour=13),
+                short_visit: monday.replace(hour=10),
+            },
+        )
+        # Office hours of the location
+        self.test_location.calendar_id = self.env["resource.calendar"].create(
+            {
+                "name": "Afternoon Office",
+                "tz": "UTC",
+                "attendance_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "name": "Monday Afternoon",
+                            "dayofweek": "0",
+                            "hour_from": 15,
+                            "hour_to": 18,
+                        },
+                    )
+                ],
+            }
+        )
+        slots = short_visit._get_earliest_slots(monday.replace(hour=8), days=1)
+        self.assertEqual(slots, {short_visit: monday.replace(hour=15)})
+
+    def test_fsm_order_earliest_slots_keep_current(self):
+        calendar = self.env["resource.calendar"].create(
+            {"name": "Slotting Calendar", "tz": "UTC"}
+        )
+        person = self.env["fsm.person"].create(
+            {"name": "Slotting Worker", "calendar_id": calendar.id}
+        )
+        monday = datetime(2030, 1, 7)
+        urgent, stuck = self.Order.create(
+            [
+                {
+                    "location_id": self.test_location.id,
+                    "person_id": person.id,
+                    "priority": "3",
+                    "request_early": monday,
+                    "request_late": monday.replace(hour=23),
+                    "scheduled_duration": 2,
+                },
+                {
+                    "location_id": self.test_location.id,
+                    "person_id": person.id,
+                    "request_early": monday.replace(hour=20),
+                    "request_late": monday.replace(hour=22),
+                    "scheduled_date_start": monday.replace(hour=9),
+                    "scheduled_date_end": monday.replace(hour=10),
+                },
+            ]
+        )
+        slots = (urgent | stuck)._get_earliest_slots(monday.replace(hour=8), days=1)
+        # The order outside the working hours keeps its slot, the urgent one
+        # goes around it
+        self.assertEqual(slots, {urgent: monday.replace(hour=10)})
+
     def test_fsm_order(self):
         """Test creating new workorders, and test following functions,
         - _compute_duration() in hrs
@@ -0,0 +1,79 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from datetime import datetime
+
+from odoo.tests.common import TransactionCase
+from odoo.tools import SQL
+
+
+class TestFSMOrderReport(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Report = cls.env["fsm.order.report"]
+        cls.location = cls.env.ref("fieldservice.test_location")
+        cls.order = cls.env["fsm.order"].create(
+            {
+                "location_id": cls.location.id,
+                "request_late": datetime(2020, 1, 1),
+                "scheduled_date_start": datetime(2030, 1, 9, 8),
+                "scheduled_duration": 2,
+            }
+        )
+
+    def test_order_report_refresh(self):
+        self.Report._cron_refresh()
+        report = self.Report.search([("order_id", "=", self.order.id)])
+        self.assertEqual(report.team_id, self.order.team_id)
+        self.assertEqual(report.territory_id, self.location.territory_id)
+        self.assertEqual(str(report.scheduled_week), "2030-01-07")
+        self.assertEqual(report.sla_breached, 1)
+        self.order.write(
+            {
+                "date_start": datetime(2030, 1, 9, 8),
+                "date_end": datetime(2030, 1, 9, 11),
+                "stage_id": self.env.ref("fieldservice.fsm_stage_cancelled").id,
+            }
+        )
+        self.Report._cron_refresh()
+        self.assertEqual(report.stage_id.is_closed, True)
+        self.assertAlmostEqual(report.duration, 3)
+        self.assertAlmostEqual(report.duration_variance, 1)
+        data = self.Report._read_group(
+            [("order_id", "=", self.order.id)], [], ["nbr:sum", "duration:sum"]
+        )
+        self.assertEqual(data, [(1, 3.0)])
+
+    def _backdate(self, records):
+        # As if they had been written well before the previous refresh
+        self.env.flush_all()
+        self.env.cr.execute(
+            SQL(
+                "UPDATE %s SET write_date = write_date - interval '1 day' "
+                "WHERE id IN %s",
+                SQL.identifier(records._table),
+                tuple(records.ids),
+            )
+        )
+        records.invalidate_recordset(["write_date"])
+
+    def test_order_report_indirect_changes(self):
+        self.Report._cron_refresh()
+        report = self.Report.search([("order_id", "=", self.order.id)])
+        self._backdate(self.order)
+        # Closed flag propagated from the stage in SQL
+        self.order.stage_id.is_closed = True
+        self.Report._cron_refresh()
+        self.assertTrue(report.is_closed)
+        self._backdate(self.order | self.location)
+        # Territory fields following the location
+        territory = self.env["res.territory"].create({"name": "Report Territory"})
+        self.location.territory_id = territory
+        self.Report._cron_refresh()
+        self.assertEqual(report.territory_id, territory)
+
+    def test_order_report_unlink(self):
+        self.Report._cron_refresh()
+        self.order.unlink()
+        # Gone with the order, without waiting for the next refresh
+        self.assertFalse(self.Report.search([("order_id", "=", self.order.id)]))
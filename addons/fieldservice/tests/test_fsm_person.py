@@ -64,3 +64,21 @@ class FSMPerson(TransactionCase):
         search_domain = [("location_ids", "=", "Location")]
         workers = self.Worker.search(search_domain)
         self.assertEqual(len(workers), 3, "Incorrect search number result")
+        # Test search using a list of locations, combined with other terms
+        search_domain = [
+            ("location_ids", "in", [location_1.id, location_3.id]),
+            ("id", "!=", person_3.id),
+        ]
+        workers = self.Worker.search(search_domain)
+        self.assertEqual(workers, person_1)
+        # Test search on a location subtree
+        location_3.fsm_parent_id = location_2
+        location_2.fsm_parent_id = location_1
+        search_domain = [("location_ids", "child_of", location_2.id)]
+        workers = self.Worker.search(search_domain)
+        self.assertEqual(workers, person_2 + person_3)
+        # Test limit, offset and order are applied
+        search_domain = [("location_ids", "=", "Location")]
+        workers = self.Worker.search(search_domain, order="id", limit=2, offset=1)
+        self.assertEqual(workers.ids, sorted((person_1 + person_2 + person_3).ids)[1:3])
+        self.assertEqual(self.Worker.search_count(search_domain), 3)
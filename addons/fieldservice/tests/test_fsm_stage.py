@@ -0,0 +1,97 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.exceptions import ValidationError
+from odoo.tests import HttpCase, tagged
+from odoo.tests.common import TransactionCase
+
+
+class TestFSMStage(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Stage = cls.env["fsm.stage"]
+
+    def _stage_vals(self, name, sequence, **vals):
+        return {"name": name, "stage_type": "worker", "sequence": sequence, **vals}
+
+    def test_fsm_stage_duplicate_sequence(self):
+        stages = self.Stage.create(
+            [self._stage_vals("On Leave", 51), self._stage_vals("Retired", 52)]
+        )
+        # Within the batch and against the existing stages
+        with self.assertRaises(ValidationError):
+            self.Stage.create(
+                [self._stage_vals("Training", 53), self._stage_vals("Sick", 53)]
+            )
+        with self.assertRaises(ValidationError):
+            self.Stage.create([self._stage_vals("Training", 51)])
+        with self.assertRaises(ValidationError):
+            stages[1].sequence = 51
+        # Archived stages do not take their sequence
+        stages[0].active = False
+        self.Stage.create([self._stage_vals("Training", 51)])
+        with self.assertRaises(ValidationError):
+            stages[0].active = True
+        self.Stage.create([self._stage_vals("Sick", 51, active=False)])
+
+    def test_fsm_stage_duplicate_sequence_company(self):
+        company = self.env["res.company"].create({"name": "Stage Company"})
+        self.Stage.create([self._stage_vals("On Leave", 51)])
+        # Each company has its own sequences, the shared stages as well
+        other = self.Stage.create(
+            [self._stage_vals("On Leave", 51, company_id=company.id)]
+        )
+        self.Stage.create([self._stage_vals("On Leave", 51, company_id=False)])
+        with self.assertRaises(ValidationError):
+            self.Stage.create([self._stage_vals("Sick", 51, company_id=company.id)])
+        with self.assertRaises(ValidationError):
+            self.Stage.create([self._stage_vals("Sick", 51, company_id=False)])
+        with self.assertRaises(ValidationError):
+            other.company_id = self.env.company
+
+    def test_fsm_stage_resequence(self):
+        first, second = self.Stage.create(
+            [self._stage_vals("On Leave", 51), self._stage_vals("Retired", 52)]
+        )
+        (second + first).web_resequence({"sequence": {}}, offset=51)
+        self.assertEqual((first.sequence, second.sequence), (52, 51))
+
+    def test_fsm_stage_color_legend(self):
+        stage = self.Stage.create([self._stage_vals("On Leave", 51)])
+        legend = self.Stage.get_color_information()
+        self.assertIn(
+            {"color": "#FFFFFF", "field": "stage_id", "opt": "==", "value": "On Leave"},
+            legend,
+        )
+        with self.assertQueryCount(0):
+            self.assertEqual(self.Stage.get_color_information(), legend)
+        # Writing the same values keeps the caches
+        stage.write({"custom_color": "#FFFFFF", "sequence": 51})
+        stage.flush_recordset()
+        with self.assertQueryCount(0):
+            self.Stage.get_color_information()
+        stage.custom_color = "#C0392B"
+        self.assertIn(
+            {"color": "#C0392B", "field": "stage_id", "opt": "==", "value": "On Leave"},
+            self.Stage.get_color_information(),
+        )
+
+
+@tagged("post_install", "-at_install")
+class TestFSMStageColors(HttpCase):
+    def test_stage_colors(self):
+        self.authenticate("admin", "admin")
+        url = "/fieldservice/stages/colors"
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        stage = self.env.ref("fieldservice.fsm_stage_new")
+        self.assertEqual(payload["colors"][str(stage.id)], stage.custom_color)
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, f'"{payload["version"]}"')
+        response = self.url_open(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        stage.custom_color = "#C0392B"
+        response = self.url_open(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
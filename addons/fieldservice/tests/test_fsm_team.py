@@ -1,6 +1,8 @@
 # Copyright (C) 2019 - TODAY, Open Source Integrators
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from datetime import timedelta
+
 from odoo import fields
 from odoo.tests import Form
 from odoo.tests.common import TransactionCase
@@ -48,3 +50,109 @@ class FSMTeam(TransactionCase):
             ),
             (5, 3, 1),
         )
+
+    def test_auto_dispatch(self):
+        territory = self.env["res.territory"].create({"name": "Dispatch Territory"})
+        location = self.env["fsm.location"].create(
+            {
+                "name": "Dispatch Location",
+                "owner_id": self.test_location.owner_id.id,
+                "territory_id": territory.id,
+            }
+        )
+        skill = self.env["fsm.category"].create({"name": "Dispatch Skill"})
+        local, skilled, busy = self.env["fsm.person"].create(
+            [
+                {"name": "Local Worker", "territory_ids": [(6, 0, territory.ids)]},
+                {"name": "Skilled Worker", "category_ids": [(6, 0, skill.ids)]},
+                {"name": "Busy Worker", "territory_ids": [(6, 0, territory.ids)]},
+            ]
+        )
+        workers = local | skilled | busy
+        start = fields.Datetime.now().replace(microsecond=0) + timedelta(days=2)
+        self.Order.create(
+            {
+                "location_id": location.id,
+                "person_id": busy.id,
+                "scheduled_date_start": start,
+                "scheduled_duration": 2,
+            }
+        )
+        in_territory, needs_skill, overlapping, same_slot = self.Order.create(
+            [
+                {"location_id": location.id, "team_id": self.test_team.id},
+                {
+                    "location_id": location.id,
+                    "team_id": self.test_team.id,
+                    "category_ids": [(6, 0, skill.ids)],
+                },
+                {
+                    "location_id": location.id,
+                    "team_id": self.test_team.id,
+                    "scheduled_date_start": start + timedelta(hours=1),
+                    "scheduled_duration": 2,
+                },
+                {
+                    "location_id": location.id,
+                    "team_id": self.test_team.id,
+                    "scheduled_date_start": start + timedelta(hours=1),
+                    "scheduled_duration": 2,
+                },
+            ]
+        )
+        orders = in_territory | needs_skill | overlapping | same_slot
+        result = orders._auto_dispatch(workers)
+        # Territory first, then the lightest load
+        self.assertEqual(in_territory.person_id, local)
+        self.assertEqual(needs_skill.person_id, skilled)
+        # The busy worker is booked, the local one takes the first order of
+        # the slot and the second one goes out of the territory
+        self.assertEqual(overlapping.person_id, local)
+        self.assertEqual(same_slot.person_id, skilled)
+        self.assertEqual(len(result), 4)
+        self.assertFalse(orders._auto_dispatch(workers))
+
+        # The dispatch reads and writes per worker, not per order
+        def count_queries(count):
+            orders = self.Order.create(
+                [
+                    {"location_id": location.id, "team_id": self.test_team.id}
+                    for __ in range(count)
+                ]
+            )
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            self.assertEqual(len(orders._auto_dispatch(workers)), count)
+            self.env.flush_all()
+            return self.cr.sql_log_count - start
+
+        count_queries(2)
+        self.assertEqual(count_queries(2), count_queries(20))
+
+    def test_order_counters_single_query(self):
+        teams = self.Team.create([{"name": f"Counter Team {i}"} for i in range(5)])
+        self.Order.create(
+            [{"location_id": self.test_location.id, "team_id": t.id} for t in teams]
+        )
+
+        def count_queries(teams):
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            for team in self.Team.browse(teams.ids):
+                self.assertEqual(
+                    (
+                        team.order_count,
+                        team.order_need_assign_count,
+                        team.order_need_schedule_count,
+                    ),
+                    (1, 1, 1),
+                )
+            return self.cr.sql_log_count - start
+
+        self.assertEqual(count_queries(teams[:1]), count_queries(teams))
+        # Pending order changes are counted
+        self.Order.search([("team_id", "=", teams[0].id)]).person_id = self.env.ref(
+            "fieldservice.person_1"
+        )
+        teams[0].invalidate_recordset()
+        self.assertEqual(teams[0].order_need_assign_count, 0)
@@ -0,0 +1,24 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+
+
+class FSMOrderStageWizard(models.TransientModel):
+    """
+    A wizard to move a selection of fsm.order to another stage
+    """
+
+    _name = "fsm.order.stage.wizard"
+    _description = "FSM Order Stage Change"
+
+    stage_id = fields.Many2one(
+        "fsm.stage",
+        string="Stage",
+        required=True,
+        domain=[("stage_type", "=", "order")],
+    )
+
+    def action_apply(self):
+        orders = self.env["fsm.order"].browse(self._context.get("active_ids", []))
+        orders._set_stage_bulk(self.stage_id)
+        return {"type": "ir.actions.act_window_close"}
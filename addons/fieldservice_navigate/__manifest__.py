@@ -9,9 +9,14 @@
         =======================
         Adds a "Navigate" button to Field Service Orders that opens Google Maps
         with directions from your current location to the order's location.
+
+        Optimizes the daily route of each worker from the stored coordinates
+        of the order locations (nearest neighbour + 2-opt, no external
+        service), and suggests a visit sequence and ETAs.
     """,
     'author': 'Custom',
     'depends': ['fieldservice'],
+    'external_dependencies': {'python': ['numpy']},
     'data': [
         'views/fsm_order_views.xml',
     ],
@@ -1,12 +1,28 @@
 # -*- coding: utf-8 -*-
-from odoo import models, api
+from datetime import datetime, time, timedelta
+
+from odoo import models, fields, api
 from odoo.exceptions import UserError
+from odoo.tools import SQL
+import pytz
 import urllib.parse
 
+from .route_optimizer import haversine_matrix, optimize_route
+
+# Used to turn the distances into travel times for the suggested ETAs
+AVERAGE_SPEED_KMH = 40.0
+
 
 class FSMOrder(models.Model):
     _inherit = 'fsm.order'
 
+    route_sequence = fields.Integer(
+        string='Visit Sequence', readonly=True, copy=False,
+        help="Position of the order in the optimized route of the worker's day")
+    route_eta = fields.Datetime(
+        string='Suggested ETA', readonly=True, copy=False,
+        help="Arrival time suggested by the route optimization")
+
     def action_navigate_to_location(self):
         """
         Opens Google Maps with navigation from current location to order location
@@ -57,3 +73,102 @@ class FSMOrder(models.Model):
             'url': google_maps_url,
             'target': 'new',
         }
+
+    def action_optimize_route(self):
+        """
+        Optimizes the route of each worker's day covered by the selected orders
+        """
+        orders = self.filtered(lambda o: o.person_id and o.scheduled_date_start)
+        if not orders:
+            raise UserError("Select orders that are assigned and scheduled.")
+        days = set()
+        for order in orders:
+            tz = pytz.timezone(order.person_id.tz or self.env.user.tz or 'UTC')
+            day = pytz.utc.localize(order.scheduled_date_start).astimezone(tz).date()
+            days.add((order.person_id, day))
+        for person, day in days:
+            self._optimize_worker_route(person, day)
+        return True
+
+    @api.model
+    def _optimize_worker_route(self, person, day):
+        """
+        Orders the open orders scheduled for the worker on the given day (in the
+        worker's timezone) to minimize the travel
+        """
+        tz = pytz.timezone(person.tz or self.env.user.tz or 'UTC')
+        day_start = tz.localize(datetime.combine(day, time.min)).astimezone(pytz.utc)
+        day_end = day_start + timedelta(days=1)
+        orders = self.search([
+            ('person_id', '=', person.id),
+            ('scheduled_date_start', '>=', day_start.replace(tzinfo=None)),
+            ('scheduled_date_start', '<', day_end.replace(tzinfo=None)),
+            ('is_closed', '=', False),
+        ], order='scheduled_date_start, id')
+        return orders._optimize_route(person)
+
+    def _optimize_route(self, person):
+        """
+        Computes the visit sequence and suggested ETAs of the orders of one
+        worker's day, from the stored coordinates only.
+
+        The route starts at the worker's address when it is geolocated, else
+        at the stop chosen by the heuristic. Orders whose location has no
+        coordinates are visited last, without ETA.
+
+        :return: the orders in visiting order
+        """
+        if not self:
+            return self
+        located = self.filtered(
+            lambda o: o.location_id.partner_latitude or o.location_id.partner_longitude)
+        has_start = bool(person.partner_latitude or person.partner_longitude)
+        dist = haversine_matrix(
+            [person.partner_latitude] + [o.location_id.partner_latitude for o in located],
+            [person.partner_longitude] + [o.location_id.partner_longitude for o in located],
+        )
+        if not has_start:
+            # Free start: reaching the first stop costs nothing
+            dist[0, :] = 0.0
+        route = optimize_route(dist)[1:]
+        eta = min(self.mapped('scheduled_date_start'))
+        previous = 0
+        ordered = self.browse()
+        values = []
+        for sequence, node in enumerate(route, 1):
+            order = located[int(node) - 1]
+            eta += timedelta(hours=dist[previous, node] / AVERAGE_SPEED_KMH)
+            values.append((order.id, sequence, eta))
+            eta += timedelta(hours=order.scheduled_duration)
+            previous = node
+            ordered |= order
+        for sequence, order in enumerate(self - located, len(route) + 1):
+            values.append((order.id, sequence, None))
+            ordered |= order
+        self._write_route(values)
+        return ordered
+
+    def _write_route(self, values):
+        """
+        Stores the visit sequences and ETAs of a route in a single UPDATE
+
+        :param values: list of (order id, sequence, ETA or None) tuples
+        """
+        self.flush_model(['route_sequence', 'route_eta'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE fsm_order o
+            SET route_sequence = route.sequence, route_eta = route.eta,
+                write_uid = %(uid)s, write_date = %(write_date)s
+            FROM (VALUES %(rows)s) AS route(id, sequence, eta)
+            WHERE o.id = route.id
+            """,
+            uid=self.env.uid,
+            write_date=self.env.cr.now(),
+            rows=SQL(', ').join(
+                SQL('(%s::int, %s::int, %s::timestamp)', order_id, sequence, eta)
+                for order_id, sequence, eta in values
+            ),
+        ))
+        self.browse([row[0] for row in values]).invalidate_recordset(
+            ['route_sequence', 'route_eta', 'write_uid', 'write_date'])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Offline route optimization on stored coordinates.
+
+The route is an open path: it starts at a fixed node (index 0, the worker's
+own address or a free start) and ends at whichever stop comes last.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(latitudes, longitudes):
+    """
+    Returns the matrix of the great-circle distances (km) between all points
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist):
+    """
+    Builds a route from node 0 by always visiting the closest unvisited node
+    """
+    size = len(dist)
+    route = [0]
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = True
+    for _step in range(size - 1):
+        candidates = np.where(visited, np.inf, dist[route[-1]])
+        node = int(np.argmin(candidates))
+        route.append(node)
+        visited[node] = True
+    return np.array(route, dtype=int)
+
+
+def two_opt(route, dist):
+    """
+    Improves an open route by reversing segments while it shortens the path.
+    The first node stays in place. Each pass evaluates all the reversals
+    starting at a given position at once.
+    """
+    # A dummy end node at zero distance from every node turns the open path
+    # into a closed one, so the last stop can move like the others
+    size = len(dist)
+    extended = np.zeros((size + 1, size + 1))
+    extended[:size, :size] = dist
+    route = np.append(route, size)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, size - 1):
+            j = np.arange(i + 1, size)
+            before, first = route[i - 1], route[i]
+            last, after = route[j], route[j + 1]
+            delta = (
+                extended[before, last]
+                + extended[first, after]
+                - extended[before, first]
+                - extended[last, after]
+            )
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                route[i : j[best] + 1] = route[i : j[best] + 1][::-1]
+                improved = True
+    return route[:-1]
+
+
+def route_length(route, dist):
+    """
+    Returns the length of the open route
+    """
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def optimize_route(dist):
+    """
+    Returns the visiting order of the nodes, starting at node 0
+    """
+    if len(dist) < 3:
+        return np.arange(len(dist))
+    return two_opt(nearest_neighbour(dist), dist)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from odoo.tests.common import TransactionCase
+
+from ..models.route_optimizer import (
+    haversine_matrix,
+    nearest_neighbour,
+    optimize_route,
+    route_length,
+)
+
+
+class TestRouteOptimizer(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.person = cls.env["fsm.person"].create(
+            {
+                "name": "Route Worker",
+                "partner_latitude": 48.85,
+                "partner_longitude": 2.35,
+                "tz": "UTC",
+            }
+        )
+        cls.day_start = datetime(2030, 1, 7, 8, 0)
+
+    def _create_orders(self, coordinates, day_start=None):
+        day_start = day_start or self.day_start
+        owner = self.env.ref("fieldservice.test_location").owner_id
+        locations = self.env["fsm.location"].create(
+            [
+                {
+                    "name": f"Stop {index}",
+                    "owner_id": owner.id,
+                    "partner_latitude": lat,
+                    "partner_longitude": lon,
+                }
+                for index, (lat, lon) in enumerate(coordinates)
+            ]
+        )
+        return self.env["fsm.order"].create(
+            [
+                {
+                    "location_id": location.id,
+                    "person_id": self.person.id,
+                    "scheduled_date_start": day_start + timedelta(minutes=index),
+                    "scheduled_duration": 0.5,
+                }
+                for index, location in enumerate(locations)
+            ]
+        )
+
+    def test_haversine_matrix(self):
+        # Paris - London
+        dist = haversine_matrix([48.8566, 51.5074], [2.3522, -0.1278])
+        self.assertAlmostEqual(dist[0, 1], 343.5, delta=1)
+        self.assertEqual(dist[0, 0], 0)
+        self.assertTrue(np.allclose(dist, dist.T))
+
+    def test_two_opt_improves_nearest_neighbour(self):
+        rng = np.random.default_rng(42)
+        points = rng.uniform([45, 0], [46, 1], size=(60, 2))
+        dist = haversine_matrix(points[:, 0], points[:, 1])
+        greedy = nearest_neighbour(dist)
+        route = optimize_route(dist)
+        self.assertEqual(route[0], 0)
+        self.assertEqual(sorted(route), list(range(60)))
+        self.assertLessEqual(route_length(route, dist), route_length(greedy, dist))
+
+    def test_optimize_worker_route(self):
+        # Stops on a line going east, scheduled in a zigzag
+        orders = self._create_orders(
+            [(48.85, 2.45), (48.85, 2.75), (48.85, 2.55), (48.85, 2.65)]
+        )
+        unlocated = self.env["fsm.order"].create(
+            {
+                "location_id": self.env.ref("fieldservice.test_location").id,
+                "person_id": self.person.id,
+                "scheduled_date_start": self.day_start + timedelta(hours=1),
+            }
+        )
+        unlocated.location_id.write({"partner_latitude": 0, "partner_longitude": 0})
+        orders[0].action_optimize_route()
+        self.assertEqual(orders.mapped("route_sequence"), [1, 4, 2, 3])
+        self.assertEqual(unlocated.route_sequence, 5)
+        self.assertFalse(unlocated.route_eta)
+        etas = orders.sorted("route_sequence").mapped("route_eta")
+        self.assertEqual(etas, sorted(etas))
+        self.assertGreater(etas[0], self.day_start)
+
+    def test_optimize_route_query_count(self):
+        rng = np.random.default_rng(7)
+
+        # The stops of the day are read and written in batch, whatever their
+        # number: days of 10, 50 and 200 stops cost the same queries
+        def count_queries(days, count):
+            day_start = self.day_start + timedelta(days=days)
+            points = rng.uniform([48.5, 2.0], [49.2, 2.8], size=(count, 2))
+            orders = self._create_orders(points.tolist(), day_start)
+            self.env.flush_all()
+            self.env.invalidate_all()
+            start = self.cr.sql_log_count
+            route = self.env["fsm.order"]._optimize_worker_route(
+                self.person, day_start.date()
+            )
+            self.env.flush_all()
+            queries = self.cr.sql_log_count - start
+            self.assertEqual(route, orders.sorted("route_sequence"))
+            self.assertEqual(
+                sorted(orders.mapped("route_sequence")), list(range(1, count + 1))
+            )
+            return queries
+
+        queries = count_queries(1, 10)
+        self.assertEqual(count_queries(2, 50), queries)
+        self.assertEqual(count_queries(3, 200), queries)